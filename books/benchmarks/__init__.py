@@ -0,0 +1,36 @@
+"""Stand-alone benchmarks for the store API.
+
+Run them from the project directory, e.g.::
+
+    python -m benchmarks.relation_contention --threads 16
+
+Each benchmark creates a throw-away test database (like manage.py test) from
+the configured DATABASES and removes it afterwards, so it is safe to point
+them at a development server. Numbers are only meaningful on the database
+used in production (PostgreSQL); SQLite serializes all writers.
+"""
+import os
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'books.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.conf import settings
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+        teardown_test_environment
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
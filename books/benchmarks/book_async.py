@@ -0,0 +1,139 @@
+"""Concurrent throughput of the sync and async book read paths under ASGI.
+
+Requests for /book/ and /book/{id}/ are sent straight to Django's
+ASGIHandler, in-process, by --concurrency clients at a time, once through
+the BookViewSet routes (sync views, run by Django in a thread per request)
+and once through BookReadView (async views on the async ORM and cache).
+Every query is delayed by --db-latency ms, standing in for the round trip
+to a database server that SQLite does not have, and each client takes
+--client-delay ms to read every response chunk.
+
+The sync-only ForceDebugToolbarMiddleware is left out, as it would run
+the async views in a thread as well. The cache is disabled so that every
+request reaches the database.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+
+from benchmarks import setup, test_database
+from benchmarks.book_serializers import seed
+
+# URLconf of the async run.
+urlpatterns = []
+
+
+class ThreadCounter:
+    """Peak number of threads while the counter runs."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self.running = False
+
+    async def run(self):
+        self.running = True
+        while self.running:
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(0.005)
+
+
+async def get(app, path, client_delay):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+    status = None
+
+    async def receive():
+        message = next(messages, None)
+        if message is None:
+            # The client never disconnects; Django cancels this once the
+            # response is sent.
+            await asyncio.Event().wait()
+        return message
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif client_delay:
+            await asyncio.sleep(client_delay)
+
+    await app(scope, receive, send)
+    assert status == 200, (path, status)
+
+
+async def load(app, paths, requests, concurrency, client_delay):
+    latencies = []
+    queue = list(paths * (requests // len(paths) + 1))[:requests]
+    random.shuffle(queue)
+
+    async def client():
+        while queue:
+            path = queue.pop()
+            start = time.perf_counter()
+            await get(app, path, client_delay)
+            latencies.append(time.perf_counter() - start)
+
+    threads = ThreadCounter()
+    counter = asyncio.ensure_future(threads.run())
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    threads.running = False
+    await counter
+    return requests / elapsed, statistics.quantiles(latencies, n=20)[-1] * 1000, threads.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--db-latency', type=float, default=2, help='ms added to every query')
+    parser.add_argument('--client-delay', type=float, default=5, help='ms a client takes per response chunk')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIHandler
+    from django.db.backends.signals import connection_created
+    from django.test import override_settings
+
+    from books import urls
+    from store.models import Book
+
+    urlpatterns.extend(urls.async_book_urls + urls.urlpatterns)
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(args.db_latency / 1000)
+        return execute(sql, params, many, context)
+
+    def add_delay(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    with test_database():
+        seed(args.books, args.readers)
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        paths = ['/book/'] + [f'/book/{book_id}/' for book_id in random.sample(book_ids, 50)]
+        connection_created.connect(add_delay)
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')]
+        for label, urlconf in (('sync', 'books.urls'), ('async', __name__)):
+            with override_settings(ROOT_URLCONF=urlconf, MIDDLEWARE=middleware, STORE_CACHE_TIMEOUT=0,
+                                   PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_REQUEST_MS=10 ** 6):
+                app = ASGIHandler()
+                for concurrency in args.concurrency:
+                    rate, p95, threads = asyncio.run(load(app, paths, args.requests, concurrency,
+                                                          args.client_delay / 1000))
+                    print(f'{label:>6} x{concurrency:<4}: {rate:7.1f} req/s, p95 {p95:8.2f} ms, '
+                          f'peak {threads} threads')
+
+
+if __name__ == '__main__':
+    main()
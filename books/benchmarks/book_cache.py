@@ -0,0 +1,71 @@
+"""Throughput of /book/ list pages with the response cache off and on.
+
+The same mix of list queries (ordering, search, filters) is requested
+repeatedly; with the cache on, only the first request of each query
+renders the page.
+"""
+import argparse
+import itertools
+import random
+import time
+
+from benchmarks import setup, test_database
+
+QUERIES = [
+    {},
+    {'ordering': 'price'},
+    {'ordering': '-author'},
+    {'search': 'Author 1'},
+    {'price': '15.00'},
+    {'page_size': 200},
+]
+
+
+def seed(books, readers):
+    from django.contrib.auth.models import User
+
+    from store.models import Book, UserBookRelation
+
+    users = User.objects.bulk_create(
+        User(username=f'reader{i}', first_name=f'Name {i}', last_name='Reader') for i in range(readers))
+    books = Book.objects.bulk_create(
+        Book(name=f'Book {i}', price=10 + i % 20, author=f'Author {i % 100}') for i in range(books))
+    UserBookRelation.objects.bulk_create(
+        UserBookRelation(user=user, book=book, like=random.random() < 0.5, rate=random.randint(1, 5))
+        for book in books for user in random.sample(users, min(len(users), 10)))
+
+
+def run(label, timeout, requests):
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+
+    from store.cache import cache_stats
+
+    cache.clear()
+    client = Client()
+    with override_settings(STORE_CACHE_TIMEOUT=timeout):
+        start = time.perf_counter()
+        for data in itertools.islice(itertools.cycle(QUERIES), requests):
+            response = client.get('/book/', data=data)
+            assert response.status_code == 200, response.status_code
+        elapsed = time.perf_counter() - start
+    stats = cache_stats()['list']
+    print(f'{label:>8}: {requests / elapsed:8.1f} req/s ({stats["hits"]} hits, {stats["misses"]} misses)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        seed(args.books, args.readers)
+        run('uncached', 0, args.requests)
+        run('cached', 300, args.requests)
+
+
+if __name__ == '__main__':
+    main()
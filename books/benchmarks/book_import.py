@@ -0,0 +1,59 @@
+"""Throughput and memory use of manage.py import_books.
+
+An NDJSON feed of --rows books is imported twice: the second run finds
+every book and updates the price of one in ten. The peak of traced Python
+memory is reported next to the one of a feed ten times smaller, which it
+should match as the feed is streamed in chunks.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import setup, test_database
+
+
+def write_feed(path, rows, update=False):
+    with open(path, 'w', encoding='utf-8') as feed:
+        for i in range(rows):
+            price = 10 + i % 50 + (1 if update and i % 10 == 0 else 0)
+            feed.write(json.dumps({'name': f'Book {i}', 'author': f'Author {i % 1000}', 'price': price}) + '\n')
+
+
+def run(label, path):
+    from store.importer import import_books, read_rows
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(path, encoding='utf-8') as feed:
+        counts = import_books(read_rows(feed, 'ndjson'))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rows = sum(counts.values())
+    print(f'{label:>16}: {rows / elapsed:9.0f} rows/s, peak {peak / 2 ** 20:6.1f} MiB '
+          f'({counts["created"]} created, {counts["updated"]} updated, {counts["unchanged"]} unchanged)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    setup()
+    with test_database(), tempfile.TemporaryDirectory() as directory:
+        from store.models import Book
+
+        path = os.path.join(directory, 'books.ndjson')
+        for rows in (args.rows // 10, args.rows):
+            Book.objects.all().delete()
+            write_feed(path, rows)
+            run(f'{rows} new', path)
+            write_feed(path, rows, update=True)
+            run(f'{rows} existing', path)
+
+
+if __name__ == '__main__':
+    main()
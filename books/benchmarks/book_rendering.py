@@ -0,0 +1,62 @@
+"""Render times of JSONRenderer and FastJSONRenderer on large book lists.
+
+Two payloads are rendered: --books serialized books as BookViewSet.list
+returns them (prices already strings), and the same books as raw values()
+rows with Decimal prices and datetimes. FastJSONRenderer is timed with
+orjson when it is installed and with its stdlib fallback.
+"""
+import argparse
+import statistics
+import time
+from unittest import mock
+
+from benchmarks import setup, test_database
+from benchmarks.book_serializers import seed
+
+
+def timed(renderer, data, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        renderer.render(data)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--readers', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from rest_framework.renderers import JSONRenderer
+
+        from books.renderers import FastJSONRenderer, orjson
+        from store.models import Book
+        from store.serializers import BookRowsSerializer
+        from store.views import BookViewSet
+
+        seed(args.books, args.readers)
+        rows = list(BookRowsSerializer.values(BookViewSet.queryset))
+        payloads = {
+            'serialized': BookRowsSerializer(rows).data,
+            'values': list(Book.objects.values()),
+        }
+        renderers = [('JSONRenderer', JSONRenderer(), False), ('FastJSONRenderer stdlib', FastJSONRenderer(), False)]
+        if orjson is not None:
+            renderers.append(('FastJSONRenderer orjson', FastJSONRenderer(), True))
+
+        for payload, data in payloads.items():
+            size = len(JSONRenderer().render(data))
+            print(f'{payload}: {len(data)} books, {size / 2 ** 20:.1f} MiB')
+            for label, renderer, use_orjson in renderers:
+                with mock.patch.object(FastJSONRenderer, 'use_orjson', use_orjson):
+                    ms = timed(renderer, data, args.repeat)
+                print(f'{label:>25}: {ms:8.2f} ms, {len(data) / ms * 1000:9.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Rows per second of BookSerializer and BookRowsSerializer.
+
+Pages of --page-size books, with their readers preview, are fetched and
+serialized the way BookViewSet.list does with STORE_BOOK_FAST_LIST off and
+on, queries included.
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup, test_database
+
+
+def seed(books, readers):
+    from django.contrib.auth.models import User
+
+    from store.logic import rebuild_book_counters
+    from store.models import Book, UserBookRelation
+
+    users = User.objects.bulk_create(
+        User(username=f'reader{i}', first_name=f'Name {i}', last_name='Reader') for i in range(readers))
+    books = Book.objects.bulk_create(
+        Book(name=f'Book {i}', price=10 + i % 20, author=f'Author {i % 100}', owner=random.choice(users))
+        for i in range(books))
+    UserBookRelation.objects.bulk_create(
+        UserBookRelation(user=user, book=book, like=random.random() < 0.5, rate=random.randint(1, 5))
+        for book in books for user in random.sample(users, min(len(users), 8)))
+    rebuild_book_counters()
+
+
+def run(label, serialize, pages, page_size):
+    from rest_framework.renderers import JSONRenderer
+
+    from store.models import Book
+
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+    start = time.perf_counter()
+    for page in range(pages):
+        first = book_ids[page * page_size % (len(book_ids) - page_size)]
+        JSONRenderer().render(serialize(first, page_size))
+    elapsed = time.perf_counter() - start
+    print(f'{label:>20}: {pages * page_size / elapsed:9.0f} rows/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from store.serializers import BookRowsSerializer, BookSerializer
+        from store.views import BookViewSet
+
+        def model_serializer(first, size):
+            books = BookViewSet.queryset.filter(pk__gte=first)[:size]
+            return BookSerializer(books, many=True).data
+
+        def rows_serializer(first, size):
+            rows = list(BookRowsSerializer.values(BookViewSet.queryset.filter(pk__gte=first))[:size])
+            return BookRowsSerializer(rows).data
+
+        seed(args.books, args.readers)
+        run('BookSerializer', model_serializer, args.pages, args.page_size)
+        run('BookRowsSerializer', rows_serializer, args.pages, args.page_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Per-request latency with and without reusing PostgreSQL connections.
+
+Book detail requests go through Django's WSGIHandler, which like a real
+server closes or releases the connection once each request is over
+(unlike the test client). Each mode runs in a process of its own, with
+the DB_* environment variables of books.database:
+
+* per-request: DB_POOL=0 DB_CONN_MAX_AGE=0, a new connection every request;
+* persistent: DB_POOL=0 DB_CONN_MAX_AGE=60;
+* pool: DB_POOL=1.
+
+The benchmark needs a PostgreSQL server reachable with the DB_* settings,
+and psycopg 3 with psycopg-pool; it reports itself as skipped otherwise.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+from benchmarks import setup, test_database
+
+MODES = {
+    'per-request': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': '1'},
+}
+
+
+def unavailable():
+    """Why PostgreSQL cannot be used, or None."""
+    from django.core.exceptions import ImproperlyConfigured
+    from django.db import DatabaseError, connection
+
+    if connection.vendor != 'postgresql':
+        return f'the default database is {connection.vendor}'
+    try:
+        connection.ensure_connection()
+    except (DatabaseError, ImproperlyConfigured, ImportError) as exc:
+        return str(exc).strip().splitlines()[0]
+    finally:
+        connection.close()
+    return None
+
+
+def timed(handler, path, requests):
+    times = []
+    for _ in range(requests):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(),
+        }
+        start = time.perf_counter()
+        response = handler(environ, lambda status, headers: None)
+        response.close()  # request_finished: closes or releases the connection
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return times
+
+
+def run_mode(mode, requests):
+    setup()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import override_settings
+
+    from store.models import Book
+
+    with test_database():
+        book = Book.objects.create(name='Book', price=10, author='Author')
+        with override_settings(STORE_CACHE_TIMEOUT=0, PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_REQUEST_MS=10 ** 6):
+            handler = WSGIHandler()
+            path = f'/book/{book.id}/'
+            timed(handler, path, 10)
+            times = timed(handler, path, requests)
+    median = statistics.median(times) * 1000
+    p95 = statistics.quantiles(times, n=20)[-1] * 1000
+    print(f'{mode:>12}: median {median:6.2f} ms, p95 {p95:6.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.requests)
+        return
+
+    setup()
+    reason = unavailable()
+    if reason:
+        print(f'skipped: PostgreSQL is not available ({reason})')
+        return
+    for mode, environ in MODES.items():
+        subprocess.run([sys.executable, '-m', 'benchmarks.db_pooling', '--mode', mode,
+                        '--requests', str(args.requests)], env={**os.environ, **environ}, check=True)
+
+
+if __name__ == '__main__':
+    main()
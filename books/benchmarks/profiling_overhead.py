@@ -0,0 +1,54 @@
+"""Overhead of books.profiling.ProfilingMiddleware.
+
+The same detail and list requests are timed without the middleware, then
+with it (logging nothing), and the difference per request is reported.
+The run without it comes first, before the query and serializer hooks are
+installed in the process.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup, test_database
+
+
+def timed(client, path, requests):
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test import Client, override_settings
+
+    from store.models import Book
+
+    with test_database():
+        books = Book.objects.bulk_create(
+            Book(name=f'Book {i}', price=10 + i % 20, author=f'Author {i % 100}') for i in range(200))
+        paths = {'detail': f'/book/{books[0].id}/', 'list': '/book/'}
+        without = [name for name in settings.MIDDLEWARE if name != 'books.profiling.ProfilingMiddleware']
+        results = {}
+        for label, middleware in (('off', without), ('on', settings.MIDDLEWARE)):
+            with override_settings(MIDDLEWARE=middleware, STORE_CACHE_TIMEOUT=0, PROFILING_SAMPLE_RATE=0,
+                                   PROFILING_SLOW_REQUEST_MS=10 ** 6):
+                client = Client()
+                results[label] = {name: timed(client, path, args.requests) for name, path in paths.items()}
+        for name in paths:
+            off, on = results['off'][name], results['on'][name]
+            print(f'{name:>8}: {off:7.3f} ms off, {on:7.3f} ms on, overhead {(on - off) * 1000:6.0f} us '
+                  f'({(on - off) / off:+.1%})')
+
+
+if __name__ == '__main__':
+    main()
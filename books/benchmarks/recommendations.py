@@ -0,0 +1,74 @@
+"""Build time and peak memory of manage.py build_recommendations.
+
+A synthetic catalogue of --books books gets --relations relations from
+--readers readers, who pick books with a long-tailed popularity, like real
+readers do. The build is timed with each --workers count, then run once more
+under tracemalloc for the peak of memory it allocated (NumPy arrays
+included). Seeding a million relations takes a few minutes.
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks import setup, test_database
+
+
+def seed(books, readers, relations):
+    import numpy as np
+    from django.contrib.auth.models import User
+
+    from store.models import Book, UserBookRelation
+
+    rng = np.random.default_rng(0)
+    User.objects.bulk_create((User(username=f'reader{i}') for i in range(readers)), batch_size=5000)
+    Book.objects.bulk_create((Book(name=f'Book {i}', price=10 + i % 20, author=f'Author {i % 5000}')
+                              for i in range(books)), batch_size=5000)
+    user_ids = np.array(User.objects.order_by('id').values_list('id', flat=True))
+    book_ids = np.array(Book.objects.order_by('id').values_list('id', flat=True))
+
+    popularity = 1 / np.arange(1, books + 1) ** 0.8
+    pairs = np.unique(np.column_stack([
+        rng.integers(0, readers, relations * 11 // 10),
+        rng.choice(books, relations * 11 // 10, p=popularity / popularity.sum()),
+    ]), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:relations]]
+    UserBookRelation.objects.bulk_create((
+        UserBookRelation(user_id=user_ids[user], book_id=book_ids[book], like=like, in_bookmark=bookmark, rate=rate)
+        for user, book, like, bookmark, rate in zip(
+            pairs[:, 0].tolist(), pairs[:, 1].tolist(), (rng.random(len(pairs)) < 0.4).tolist(),
+            (rng.random(len(pairs)) < 0.1).tolist(), rng.integers(1, 6, len(pairs)).tolist())
+    ), batch_size=5000)
+    return len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--readers', type=int, default=50_000)
+    parser.add_argument('--relations', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from store.recommendations import build_recommendations
+
+        start = time.perf_counter()
+        relations = seed(args.books, args.readers, args.relations)
+        print(f'seeded {args.books} books, {relations} relations in {time.perf_counter() - start:.0f} s')
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            counts = build_recommendations(workers=workers)
+            print(f'{workers:>2} workers: {time.perf_counter() - start:6.1f} s, '
+                  f'{counts["similarities"]} similarities of {counts["books"]} books')
+
+        tracemalloc.start()
+        build_recommendations()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'peak memory: {peak / 2 ** 20:.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Query-count, latency and memory regression suite of the store API.
+
+Seeds a dataset of books, readers and relations, then drives the main
+endpoints (list, ordering, search, detail, readers, relation updates)
+through the test client with the response cache off. For each scenario it
+records the number of queries, the 50th/95th percentile of the wall time
+and the peak of traced Python memory, and compares them with
+benchmarks/baseline.json:
+
+* any scenario issuing more queries than the baseline fails, whatever the
+  database and dataset size, as query counts must not grow with the data;
+* times and memory fail beyond --tolerance above the baseline of the same
+  database and profile.
+
+Runs on an in-memory SQLite database by default; --db postgres uses the
+DATABASES of books.settings instead::
+
+    python -m benchmarks.regression --profile small
+    python -m benchmarks.regression --db postgres --profile medium
+    python -m benchmarks.regression --update-baseline
+
+Exits with status 1 on a regression.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks import setup, test_database
+
+BASELINE = Path(__file__).with_name('baseline.json')
+
+# books, readers, relations per book
+PROFILES = {
+    'small': (500, 50, 5),
+    'medium': (5000, 200, 10),
+    'large': (50000, 1000, 20),
+}
+
+# Transaction control statements depend on whether the caller already is in
+# a transaction (tests are), so they are not counted.
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+SCENARIOS = {}
+
+
+def scenario(function):
+    SCENARIOS[function.__name__.replace('_', '-')] = function
+    return function
+
+
+class Dataset:
+    def __init__(self, book_ids, user):
+        self.book_ids = book_ids
+        self.user = user
+        self.random = random.Random(0)
+        self.rates = itertools.cycle(range(1, 6))
+
+    def book_id(self):
+        return self.random.choice(self.book_ids)
+
+
+def seed(books, readers, relations_per_book):
+    from django.contrib.auth.models import User
+
+    from store.logic import rebuild_book_counters
+    from store.models import Book, UserBookRelation
+
+    rng = random.Random(0)
+    users = User.objects.bulk_create(
+        User(username=f'reader{i}', first_name=f'Name {i}', last_name='Reader') for i in range(readers))
+    owners = users[:10]
+    book_objects = Book.objects.bulk_create(
+        (Book(name=f'Book {i}', price=10 + i % 50, author=f'Author {i % 300}', owner=rng.choice(owners))
+         for i in range(books)), batch_size=1000)
+    UserBookRelation.objects.bulk_create(
+        (UserBookRelation(user=user, book=book, like=rng.random() < 0.5, in_bookmark=rng.random() < 0.2,
+                          rate=rng.randint(1, 5))
+         for book in book_objects for user in rng.sample(users, min(readers, relations_per_book))),
+        batch_size=1000)
+    rebuild_book_counters()
+    return Dataset([book.pk for book in book_objects], User.objects.create(username='benchmark'))
+
+
+@scenario
+def book_list(client, dataset):
+    return client.get('/book/')
+
+
+@scenario
+def book_list_large_page(client, dataset):
+    return client.get('/book/', data={'page_size': 200})
+
+
+@scenario
+def book_list_price(client, dataset):
+    return client.get('/book/', data={'ordering': '-price'})
+
+
+@scenario
+def book_search(client, dataset):
+    return client.get('/book/', data={'search': f'author {dataset.random.randrange(300)}'})
+
+
+@scenario
+def book_filter(client, dataset):
+    return client.get('/book/', data={'price': 10 + dataset.random.randrange(50)})
+
+
+@scenario
+def book_detail(client, dataset):
+    return client.get(f'/book/{dataset.book_id()}/')
+
+
+@scenario
+def book_readers(client, dataset):
+    return client.get(f'/book/{dataset.book_id()}/readers/')
+
+
+@scenario
+def relation_update(client, dataset):
+    # A new rate every time, so that the relation always changes.
+    return client.patch(f'/book_relation/{dataset.book_ids[0]}/', data={'rate': next(dataset.rates)},
+                        format='json')
+
+
+@scenario
+def relation_bulk(client, dataset):
+    rate = next(dataset.rates)
+    data = [{'book': book_id, 'rate': rate} for book_id in dataset.book_ids[:100]]
+    return client.post('/book_relation/bulk/', data=data, format='json')
+
+
+def count_queries(queries):
+    return sum(1 for query in queries if not query['sql'].startswith(TRANSACTION_STATEMENTS))
+
+
+def client_for(dataset):
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(dataset.user)
+    return client
+
+
+def measure(name, dataset, repeat):
+    """Queries, p50/p95 in milliseconds and peak KiB of a scenario."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    request = SCENARIOS[name]
+    client = client_for(dataset)
+    queries = 0
+    times = []
+    for index in range(repeat + 2):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(client, dataset)
+            elapsed = time.perf_counter() - start
+        assert response.status_code == 200, (name, response.status_code)
+        queries = max(queries, count_queries(captured.captured_queries))
+        # The first requests warm up caches of Django and the database.
+        if index >= 2:
+            times.append(elapsed * 1000)
+
+    tracemalloc.start()
+    request(client, dataset)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(times, n=20, method='inclusive')
+    return {'queries': queries, 'p50_ms': round(statistics.median(times), 2), 'p95_ms': round(percentiles[18], 2),
+            'peak_kib': round(peak / 1024)}
+
+
+def compare(results, baseline, key, tolerance):
+    """Regressions of results against baseline, as messages."""
+    failures = []
+    for name, result in results.items():
+        expected = baseline['queries'].get(name)
+        if expected is not None and result['queries'] > expected:
+            failures.append(f'{name}: {result["queries"]} queries, baseline {expected}')
+        timings = baseline['timings'].get(key, {}).get(name)
+        if timings is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'peak_kib'):
+            limit = timings[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                failures.append(f'{name}: {metric} {result[metric]}, baseline {timings[metric]} '
+                                f'(limit {limit:.1f})')
+    return failures
+
+
+def load_baseline():
+    if not BASELINE.exists():
+        return {'queries': {}, 'timings': {}}
+    return json.loads(BASELINE.read_text())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--profile', choices=PROFILES, default='small')
+    parser.add_argument('--repeat', type=int, default=30, help='Timed requests per scenario.')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Only run these scenarios.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed relative increase of times and memory over the baseline.')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Record the results as the new baseline instead of comparing.')
+    args = parser.parse_args()
+
+    if args.db == 'sqlite':
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.sqlite_settings')
+    setup()
+    from django.db import connection
+    from django.test import override_settings
+
+    key = f'{connection.vendor}/{args.profile}'
+    results = {}
+    with test_database(), override_settings(STORE_CACHE_TIMEOUT=0):
+        dataset = seed(*PROFILES[args.profile])
+        for name in args.scenario or SCENARIOS:
+            results[name] = measure(name, dataset, args.repeat)
+            result = results[name]
+            print(f'{name:>22}: {result["queries"]:3d} queries, p50 {result["p50_ms"]:8.2f} ms, '
+                  f'p95 {result["p95_ms"]:8.2f} ms, peak {result["peak_kib"]:6d} KiB')
+
+    baseline = load_baseline()
+    if args.update_baseline:
+        baseline['queries'].update({name: result['queries'] for name, result in results.items()})
+        baseline['timings'].setdefault(key, {}).update({
+            name: {metric: value for metric, value in result.items() if metric != 'queries'}
+            for name, result in results.items()
+        })
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        print(f'Baseline {key} updated')
+        return
+
+    if key not in baseline['timings']:
+        print(f'No timings recorded for {key}, only query counts are compared')
+    failures = compare(results, baseline, key, args.tolerance)
+    for failure in failures:
+        print(f'REGRESSION {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
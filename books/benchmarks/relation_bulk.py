@@ -0,0 +1,62 @@
+"""Latency of POST /book_relation/bulk/ with STORE_RELATION_BULK_MAX_ITEMS
+relations.
+
+Each user posts the relations of --books books twice: the first request
+inserts every relation, the second changes the rate of all of them. The
+median and worst latency of --repeat users are reported with the number of
+queries of one request.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup, test_database
+
+
+def run(label, users, url, data_of):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    timings = []
+    for user in users:
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.post(url, data=data_of(user), format='json')
+            timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise SystemExit(f'{label}: {response.status_code} {response.content[:200]}')
+    print(f'{label:>8}: median {statistics.median(timings) * 1000:8.1f} ms, '
+          f'max {max(timings) * 1000:8.1f} ms, {len(queries)} queries')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=None,
+                        help='Relations per request, STORE_RELATION_BULK_MAX_ITEMS by default.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.urls import reverse
+
+        from store.models import Book
+
+        count = args.books or settings.STORE_RELATION_BULK_MAX_ITEMS
+        books = Book.objects.bulk_create(Book(name=f'Book {i}', price=i % 100) for i in range(count))
+        users = User.objects.bulk_create(User(username=f'user-{i}') for i in range(args.repeat))
+        url = reverse('userbookrelation-bulk')
+
+        run('insert', users, url, lambda user: [
+            {'book': book.id, 'like': i % 2 == 0, 'rate': i % 5 + 1} for i, book in enumerate(books)])
+        run('update', users, url, lambda user: [
+            {'book': book.id, 'rate': 5 - i % 5} for i, book in enumerate(books)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Many users rating and liking the same book concurrently through
+UserBooksRelationView, with STORE_COUNTER_MODE 'direct' and 'buffered'.
+
+Reports requests per second, the time spent in UPDATEs of store_book,
+which is where writers wait for the book's row lock, and the time spent in
+the SELECT ... FOR UPDATE of the relation rows, where writers of the same
+relation wait for each other.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks import setup, test_database
+
+
+class StatementTimer:
+    """connection.execute_wrapper that sums the time of the UPDATEs of
+    store_book and of the locking SELECTs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = {'update': 0.0, 'lock': 0.0}
+        self.statements = {'update': 0, 'lock': 0}
+
+    def install(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith('UPDATE "store_book"'):
+            kind = 'update'
+        elif sql.startswith('SELECT') and ' FOR UPDATE' in sql:
+            kind = 'lock'
+        else:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.seconds[kind] += time.perf_counter() - start
+                self.statements[kind] += 1
+
+
+def hammer(users, book, requests_per_user, errors):
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    url = reverse('userbookrelation-detail', args=(book.id,))
+    barrier = threading.Barrier(len(users))
+
+    def worker(user):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        for _ in range(requests_per_user):
+            data = random.choice([{'like': random.random() < 0.5}, {'rate': random.randint(1, 5)}])
+            response = client.patch(url, data=data, format='json')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(mode, threads, requests_per_user):
+    from django.contrib.auth.models import User
+    from django.db.backends.signals import connection_created
+    from django.test import override_settings
+
+    from store.counter_buffer import get_counter_buffer
+    from store.models import Book, UserBookRelation
+
+    book = Book.objects.create(name=f'Hot book {mode}', price=10, author='Author')
+    users = User.objects.bulk_create(User(username=f'{mode}-{i}') for i in range(threads))
+    timer = StatementTimer()
+    errors = []
+
+    # Every thread (requests and the buffer worker) opens its own connection.
+    connection_created.connect(timer.install)
+    try:
+        with override_settings(STORE_COUNTER_MODE=mode):
+            start = time.perf_counter()
+            hammer(users, book, requests_per_user, errors)
+            if mode == 'buffered':
+                get_counter_buffer().stop()
+            elapsed = time.perf_counter() - start
+    finally:
+        connection_created.disconnect(timer.install)
+
+    book.refresh_from_db()
+    relations = UserBookRelation.objects.filter(book=book)
+    consistent = (book.ratings_count, book.likes_count) == (relations.count(), relations.filter(like=True).count())
+    total = threads * requests_per_user
+    print(f'{mode:>8}: {total / elapsed:8.1f} req/s, {timer.statements["update"]:5d} book UPDATEs, '
+          f'{timer.seconds["update"] * 1000:9.1f} ms in book UPDATEs, {timer.statements["lock"]:5d} locking SELECTs, '
+          f'{timer.seconds["lock"] * 1000:9.1f} ms in locking SELECTs, {len(errors)} errors, '
+          f'counters {"consistent" if consistent else "INCONSISTENT"}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per thread.')
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        for mode in ('direct', 'buffered'):
+            run(mode, args.threads, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""books.settings on a local SQLite database, for benchmarks that do not
+need PostgreSQL."""
+from books.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'benchmarks.sqlite3',  # noqa: F405
+    }
+}
@@ -0,0 +1,58 @@
+"""DATABASES['default'] from the environment.
+
+DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT locate the PostgreSQL
+database. Connections are reused across requests in one of two ways:
+
+* DB_POOL=1 (the default): psycopg's connection pool, shared by the
+  threads of a server process and sized by DB_POOL_MIN_SIZE and
+  DB_POOL_MAX_SIZE; a request waits up to DB_POOL_TIMEOUT seconds for a
+  free connection. Connections are checked before being handed out. This
+  needs psycopg 3 with psycopg-pool, and is the one to use under ASGI,
+  where persistent connections are not reused.
+* DB_POOL=0: persistent connections, kept for DB_CONN_MAX_AGE seconds (0
+  closes them after every request, "none" never) and checked before each
+  request reuses them.
+
+DB_REPLICA_HOSTS lists read replicas as comma-separated host or host:port
+addresses, configured like the primary otherwise.
+"""
+import copy
+import os
+
+TRUE = ('1', 'true', 'yes', 'on')
+
+
+def database_settings(environ=os.environ):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': environ.get('DB_NAME', 'books_db'),
+        'USER': environ.get('DB_USER', 'books_user'),
+        'PASSWORD': environ.get('DB_PASSWORD', '9900'),
+        'HOST': environ.get('DB_HOST', 'localhost'),
+        'PORT': environ.get('DB_PORT', '5432'),
+        # With a pool, Django hands psycopg_pool its check_connection().
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if environ.get('DB_POOL', '1').lower() in TRUE:
+        database['OPTIONS'] = {'pool': {
+            'min_size': int(environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(environ.get('DB_POOL_TIMEOUT', '10')),
+        }}
+    else:
+        max_age = environ.get('DB_CONN_MAX_AGE', '60')
+        database['CONN_MAX_AGE'] = None if max_age.lower() == 'none' else int(max_age)
+    return database
+
+
+def replica_settings(primary, environ=os.environ):
+    """DATABASES entries replica1, replica2... for DB_REPLICA_HOSTS. Tests
+    use the primary in their place."""
+    replicas = {}
+    addresses = [address.strip() for address in environ.get('DB_REPLICA_HOSTS', '').split(',') if address.strip()]
+    for number, address in enumerate(addresses, 1):
+        host, _, port = address.partition(':')
+        replicas[f'replica{number}'] = {
+            **copy.deepcopy(primary), 'HOST': host, 'PORT': port or primary['PORT'], 'TEST': {'MIRROR': 'default'},
+        }
+    return replicas
@@ -0,0 +1,299 @@
+"""Per-request SQL and serializer profiling, cheap enough to leave on in
+production.
+
+ProfilingMiddleware records for every request the number and total time of
+its SQL queries, the slowest statements, the time spent in DRF serializers
+and the response size. It reports them:
+
+* in a Server-Timing header of the response;
+* as one JSON line on the 'books.profiling' logger for a sample of the
+  requests (PROFILING_SAMPLE_RATE) and for every request slower than
+  PROFILING_SLOW_REQUEST_MS;
+* in per-endpoint histograms served to staff by ProfilingStatsView. These
+  live in the memory of each server process, which reports its pid, next
+  to the hit rates of the store response cache (store.cache.cache_stats()).
+
+Queries are timed by a connection execute wrapper installed once on every
+connection, and serializers by the .data of ProfiledSerializerMixin, which
+the store serializers use; both only look up a context variable when no
+request is being profiled.
+"""
+import contextvars
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from store.cache import cache_stats, reset_cache_stats
+
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger('books.profiling')
+
+_current = contextvars.ContextVar('books_profile', default=None)
+_installed = False
+
+
+class Profile:
+    """What one request spent in the database and in serializers."""
+
+    def __init__(self, keep_slowest):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.keep_slowest = keep_slowest
+        self.slowest = []  # min-heap of (seconds, sql)
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_time += seconds
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, (seconds, sql))
+        elif self.slowest and seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, sql))
+
+    def slowest_queries(self):
+        return [{'sql': normalize_sql(sql), 'ms': round(seconds * 1000, 2)}
+                for seconds, sql in sorted(self.slowest, reverse=True)]
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql, max_length=300):
+    """sql with literals and placeholders replaced by ?, so that statements
+    differing only by their values (or the length of IN lists) read alike."""
+    sql = _LISTS.sub('?, ...', _LITERALS.sub('?', _SPACES.sub(' ', sql)))
+    return sql if len(sql) <= max_length else sql[:max_length - 3] + '...'
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - start)
+
+
+def _install_query_recorder(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    """Hook query timing, once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_install_query_recorder, weak=False)
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection=connection)
+
+
+class ProfiledSerializerMixin:
+    """For DRF serializers: reading .data adds to the serializer time of the
+    request being profiled. Serializers read with many=True also need
+    ProfiledListSerializer, or a subclass, as Meta.list_serializer_class."""
+
+    @property
+    def data(self):
+        profile = _current.get()
+        # Nested serializers run within the outermost one.
+        if profile is None or profile.serializing:
+            return super().data
+        profile.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+            profile.serializing = False
+
+
+class ProfiledListSerializer(ProfiledSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return {'buckets': dict(zip(labels, self.counts)), 'sum': round(self.total, 2), 'max': round(self.max, 2)}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.duration_ms = Histogram(DURATION_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.response_bytes = 0
+
+    def add(self, profile, duration, status, size):
+        self.requests += 1
+        self.errors += status >= 500
+        self.duration_ms.add(duration * 1000)
+        self.queries.add(profile.queries)
+        self.db_ms += profile.db_time * 1000
+        self.serializer_ms += profile.serializer_time * 1000
+        self.response_bytes += size or 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'duration_ms': self.duration_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+            'db_ms': round(self.db_ms, 2),
+            'serializer_ms': round(self.serializer_ms, 2),
+            'response_bytes': self.response_bytes,
+        }
+
+
+_stats_lock = threading.Lock()
+_stats = {}
+_stats_since = timezone.now()
+
+
+def record(endpoint, profile, duration, status, size):
+    with _stats_lock:
+        if endpoint not in _stats:
+            _stats[endpoint] = EndpointStats()
+        _stats[endpoint].add(profile, duration, status, size)
+
+
+def stats():
+    with _stats_lock:
+        endpoints = {endpoint: endpoint_stats.as_dict() for endpoint, endpoint_stats in sorted(_stats.items())}
+        return {'pid': os.getpid(), 'since': _stats_since.isoformat(), 'endpoints': endpoints}
+
+
+def reset_stats():
+    global _stats_since
+    with _stats_lock:
+        _stats.clear()
+        _stats_since = timezone.now()
+
+
+def endpoint_name(request):
+    """Method and URL name of the view, so that all the books share one
+    endpoint and unknown paths cannot grow the histograms."""
+    match = request.resolver_match
+    if match is None:
+        return f'{request.method} <unresolved>'
+    return f'{request.method} {match.view_name or match.route}'
+
+
+def server_timing(profile, duration):
+    return (f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries", '
+            f'serializer;dur={profile.serializer_time * 1000:.2f}, '
+            f'total;dur={duration * 1000:.2f}')
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = Profile(settings.PROFILING_SLOWEST_QUERIES)
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        # Queries run in sync_to_async threads, which copy the context and
+        # so add to the same profile.
+        profile = Profile(settings.PROFILING_SLOWEST_QUERIES)
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    def report(self, request, response, profile, duration):
+        size = None if response.streaming else len(response.content)
+        endpoint = endpoint_name(request)
+        response['Server-Timing'] = server_timing(profile, duration)
+        record(endpoint, profile, duration, response.status_code, size)
+        if duration * 1000 >= settings.PROFILING_SLOW_REQUEST_MS or random.random() < settings.PROFILING_SAMPLE_RATE:
+            logger.info(json.dumps({
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(duration * 1000, 2),
+                'queries': profile.queries,
+                'db_ms': round(profile.db_time * 1000, 2),
+                'serializer_ms': round(profile.serializer_time * 1000, 2),
+                'bytes': size,
+                'slowest': profile.slowest_queries(),
+            }))
+        return response
+
+
+class ProfilingStatsView(APIView):
+    """Per-endpoint histograms of this server process and the hit rates of
+    the store response cache; DELETE resets them."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(self.report())
+
+    def delete(self, request):
+        reset_stats()
+        reset_cache_stats()
+        return Response(self.report())
+
+    @staticmethod
+    def report():
+        return {**stats(), 'cache': cache_stats()}
@@ -0,0 +1,84 @@
+"""JSON renderer for the API, faster than DRF's JSONRenderer.
+
+FastJSONRenderer encodes with orjson when it is installed, straight to
+bytes and with datetimes, dates and UUIDs encoded natively, and falls back
+to a stdlib encoder built once per encoder class otherwise. Decimals and
+the other types DRF knows go through one default hook, Decimal first.
+
+With the default COMPACT_JSON, UNICODE_JSON and STRICT_JSON settings the
+output decodes to the same values as that of JSONRenderer, except that
+orjson writes non-finite floats as null where JSONRenderer raises. It is
+the same bytes too, but for floats below 1e-4 in magnitude: orjson writes
+0.00001 and 1.5e-7 where the stdlib writes 1e-05 and 1.5e-07. What orjson
+cannot encode, such as integers beyond 64 bits, is retried with the
+stdlib.
+Indented responses (an Accept header with indent=N) and other settings are
+left to JSONRenderer.
+
+It is the default renderer; a view can still pick either one with
+renderer_classes.
+"""
+from decimal import Decimal
+from functools import cache
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson and orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+# Escaped like JSONRenderer does, so that the output is valid JavaScript.
+LINE_SEPARATORS = (('\u2028', '\\u2028'), ('\u2029', '\\u2029'))
+LINE_SEPARATOR_BYTES = tuple((separator.encode(), escaped.encode()) for separator, escaped in LINE_SEPARATORS)
+
+
+@cache
+def _default(encoder_class):
+    fallback = encoder_class().default
+
+    def default(obj):
+        # Serializers coerce decimals to strings by default, but values()
+        # rows and aggregates reach the renderer as Decimal.
+        if type(obj) is Decimal:
+            return float(obj)
+        return fallback(obj)
+
+    return default
+
+
+@cache
+def _stdlib_encoder(encoder_class):
+    return encoder_class(ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                         default=_default(encoder_class))
+
+
+class FastJSONRenderer(JSONRenderer):
+    use_orjson = orjson is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (self.ensure_ascii or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.use_orjson:
+            try:
+                ret = orjson.dumps(data, default=_default(self.encoder_class), option=ORJSON_OPTIONS)
+            except orjson.JSONEncodeError:
+                # Integers beyond 64 bits, for one; the stdlib encoder
+                # takes them or raises the error JSONRenderer would.
+                pass
+            else:
+                for separator, escaped in LINE_SEPARATOR_BYTES:
+                    if separator in ret:
+                        ret = ret.replace(separator, escaped)
+                return ret
+
+        ret = _stdlib_encoder(self.encoder_class).encode(data)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret.encode()
@@ -0,0 +1,106 @@
+"""Reads of safe API requests from read replicas.
+
+ReplicaRouter sends every write, and by default every read, to the default
+(primary) database. ReplicaReadMixin routes the reads of GET and HEAD
+requests on a view to the DATABASE_REPLICAS in turn, once the request is
+authenticated, so that sessions and users are read from the primary.
+
+Replicas lag behind the primary, so a user who just wrote would not always
+see the change. The writes of the mixin's views therefore start a window of
+DATABASE_READ_YOUR_WRITES_SECONDS in which that user's reads stay on the
+primary; it is kept in the default cache, which must be shared by the
+server processes.
+
+The routing is held in a context variable, set for the request by
+routing() and reset after it, also when the view raises. Async views look
+the window up with awrote_recently() before initial().
+"""
+import contextlib
+import contextvars
+import itertools
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+WROTE_KEY = 'books:wrote:{user_id}'
+
+_replica = contextvars.ContextVar('books_replica', default=None)
+_turn = itertools.count()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication.
+        return db not in settings.DATABASE_REPLICAS
+
+
+def use_replica():
+    """Send the reads of the current context to the next replica, if any."""
+    replicas = settings.DATABASE_REPLICAS
+    if replicas:
+        _replica.set(replicas[next(_turn) % len(replicas)])
+
+
+@contextlib.contextmanager
+def routing():
+    """Scope of the routing of one request: reads go to the primary unless
+    use_replica() is called within it."""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def record_write(user):
+    if settings.DATABASE_REPLICAS and user.is_authenticated:
+        cache.set(WROTE_KEY.format(user_id=user.pk), True, settings.DATABASE_READ_YOUR_WRITES_SECONDS)
+
+
+def wrote_recently(user):
+    return user.is_authenticated and cache.get(WROTE_KEY.format(user_id=user.pk), False)
+
+
+async def awrote_recently(user):
+    return user.is_authenticated and await cache.aget(WROTE_KEY.format(user_id=user.pk), False)
+
+
+class ReplicaReadMixin:
+    """For DRF views: reads of GET and HEAD requests go to a replica unless
+    the user wrote within DATABASE_READ_YOUR_WRITES_SECONDS; successful
+    requests with other methods start that window."""
+    # Looked up beforehand by async views, see awrote_recently().
+    recent_write = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            recent_write = self.recent_write
+            if recent_write is None:
+                recent_write = wrote_recently(request.user)
+            if not recent_write:
+                use_replica()
+
+    def dispatch(self, request, *args, **kwargs):
+        # DRF skips finalize_response() on the exceptions it re-raises.
+        with routing():
+            return super().dispatch(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            record_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from books.database import database_settings, replica_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     "debug_toolbar",
 
@@ -50,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,16 +89,37 @@ WSGI_APPLICATION = 'books.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# PostgreSQL, configured by DB_* environment variables (see books.database).
+# books.test_settings runs the tests on SQLite instead.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'books_db',
-        'USER': 'books_user',
-        'PASSWORD': '9900',
-        'HOST': 'localhost',
-        'PORT': '5432',
-    }
+    'default': database_settings(),
 }
+DATABASES.update(replica_settings(DATABASES['default']))
+
+# GET and HEAD requests on the book API read from the DATABASE_REPLICAS in
+# turn; a user's reads stay on default for DATABASE_READ_YOUR_WRITES_SECONDS
+# after their own writes (see books.routers).
+DATABASE_ROUTERS = ['books.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_READ_YOUR_WRITES_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+# The book response cache, its version counters (the ETags of book lists)
+# and the read-your-writes windows live in the default cache, which every
+# server process must share: CACHE_URL=redis://host:6379/0. Without it, the
+# cache is local to each process, which only suits a single-process server
+# such as runserver; manage.py check --deploy reports it (see store.checks).
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+    }
 
 
 # Password validation
@@ -139,7 +165,7 @@ STATIC_URL = 'static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'books.renderers.FastJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
@@ -149,4 +175,79 @@ REST_FRAMEWORK = {
 SOCIAL_AUTH_JSONFIELD_ENABLED = True
 
 SOCIAL_AUTH_GITHUB_KEY = 'Ov23lipOoAw36LQBVoFm'
-SOCIAL_AUTH_GITHUB_SECRET = '9dcc779079a3aae94773d00ae02357729b7dcb1e'
\ No newline at end of file
+SOCIAL_AUTH_GITHUB_SECRET = '9dcc779079a3aae94773d00ae02357729b7dcb1e'
+
+# Book counters: 'direct' updates the book in the same transaction as the
+# relation change, 'buffered' coalesces changes per book (see store.counter_buffer).
+STORE_COUNTER_MODE = 'direct'
+STORE_COUNTER_FLUSH_SIZE = 500
+STORE_COUNTER_FLUSH_INTERVAL = 0.5
+STORE_COUNTER_MAX_STALENESS = 5.0
+
+# /book/ list pages; clients may ask for up to STORE_BOOK_MAX_PAGE_SIZE
+# books with ?page_size=.
+STORE_BOOK_PAGE_SIZE = 50
+STORE_BOOK_MAX_PAGE_SIZE = 200
+
+# Rows fetched and serialized at a time by /book/export/.
+STORE_EXPORT_CHUNK_SIZE = 500
+
+# Readers embedded in each book of /book/; /book/{id}/readers/ pages
+# through all of them.
+STORE_BOOK_READERS_PREVIEW = 5
+
+# Serialize /book/ list pages from .values() rows (store.serializers.BookRowsSerializer)
+# instead of through BookSerializer; the JSON is the same.
+STORE_BOOK_FAST_LIST = True
+
+# Serve GET /book/ and /book/{id}/ with async views (store.views.BookReadView).
+# Only worth it under an ASGI server (books.asgi): a WSGI server has to run
+# them in an event loop of their own, and sync-only middleware such as the
+# debug toolbar's holds a thread around them.
+STORE_ASYNC_READS = False
+
+# Serialized books are cached in the default cache for this many seconds
+# (0 disables it); see store.cache for how writes invalidate them, and
+# CACHE_URL above for the cache they need.
+STORE_CACHE_TIMEOUT = 300
+
+# POST /book_relation/bulk/ accepts up to STORE_RELATION_BULK_MAX_ITEMS
+# relations and writes them STORE_RELATION_BULK_BATCH_SIZE at a time.
+STORE_RELATION_BULK_MAX_ITEMS = 10000
+STORE_RELATION_BULK_BATCH_SIZE = 500
+
+# Rows validated and upserted at a time by /book/import/ and manage.py
+# import_books.
+STORE_IMPORT_CHUNK_SIZE = 500
+
+# Books kept on each leaderboard (see store.leaderboards), and ratings a
+# book needs to be ranked by rating.
+STORE_LEADERBOARD_SIZE = 50
+STORE_LEADERBOARD_MIN_VOTES = 5
+
+# /book/facets/: width of the price buckets and number of top authors, by
+# default; clients may ask for up to STORE_FACET_MAX_AUTHORS authors.
+STORE_FACET_PRICE_BUCKET = 10
+STORE_FACET_AUTHORS = 10
+STORE_FACET_MAX_AUTHORS = 50
+
+# Neighbours kept per book by manage.py build_recommendations and listed by
+# /book/{id}/similar/ (see store.recommendations).
+STORE_SIMILAR_BOOKS = 10
+
+# Request profiling, see books.profiling: share of requests logged, requests
+# slower than this are always logged, slowest statements kept per request.
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_SLOW_REQUEST_MS = 500
+PROFILING_SLOWEST_QUERIES = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'books.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
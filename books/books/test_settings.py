@@ -0,0 +1,27 @@
+"""books.settings on an in-memory SQLite database, to run the tests without
+PostgreSQL:
+
+    python manage.py test --settings=books.test_settings
+
+Tests of row locking, which SQLite lacks, are skipped.
+"""
+from books.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    # A separate database standing in for a read replica; the tests of
+    # books.routers route to it with override_settings(DATABASE_REPLICAS=...).
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+DATABASE_REPLICAS = []
+
+# No sampled or slow-request profiles in the test output; the tests of
+# books.profiling enable them with override_settings().
+PROFILING_SAMPLE_RATE = 0
+PROFILING_SLOW_REQUEST_MS = 10 ** 6
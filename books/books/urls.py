@@ -14,13 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import SimpleRouter
 
 from debug_toolbar.toolbar import debug_toolbar_urls
 
-from store.views import BookViewSet, auth, UserBooksRelationView
+from books.profiling import ProfilingStatsView
+
+from store.views import BookReadView, BookViewSet, auth, UserBooksRelationView
 
 router = SimpleRouter()
 router.register('book', BookViewSet)
@@ -29,7 +32,18 @@ router.register('book_relation', UserBooksRelationView)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("", include('social_django.urls', namespace="social")),
-    path('auth/', auth)
+    path('auth/', auth),
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling'),
 ] + debug_toolbar_urls()
 
+# The BookViewSet list and detail routes, with GET on the async ORM. Book
+# ids are numbers, which leaves /book/export/ and the other list actions to
+# the router.
+async_book_urls = [
+    re_path(r'^book/$', BookReadView.as_view(), name='book-list'),
+    re_path(r'^book/(?P<pk>[0-9]+)/$', BookReadView.as_view(detail=True), name='book-detail'),
+]
+if settings.STORE_ASYNC_READS:
+    urlpatterns += async_book_urls
+
 urlpatterns += router.urls
\ No newline at end of file
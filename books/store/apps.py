@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from store import checks, signals  # noqa: F401
+
+        post_migrate.connect(signals.create_search_index, sender=self)
@@ -0,0 +1,198 @@
+"""Cache of serialized book representations.
+
+Keys embed version counters instead of being deleted on writes:
+
+* store:generation - bumped by invalidate_all(), part of every key;
+* store:book:<id>:version - bumped when that book or its relations change;
+* store:books:version - bumped on any book change, part of list keys;
+* store:facets:version - bumped when a book is saved or deleted, part of
+  facet keys: the counters updated by relation changes are not faceted.
+
+A write therefore costs a couple of cache.incr() calls, never a scan of
+the cached lists, and entries of old versions simply expire. Versions are
+bumped right away and again once the transaction commits, so a reader
+that cached the pre-commit state in between is invalidated too.
+
+Book keys also embed the ETag of the response, which is read from the same
+database as its data: a response built on a replica that had not yet
+received a write is not served anymore once it has. List ETags are the
+versions themselves, so that validating a list costs no query. The user
+who made a change reads lists from the primary for
+DATABASE_READ_YOUR_WRITES_SECONDS (books.routers); a list that another user
+misses on a replica lagging behind the change is cached under the new
+versions, until it expires or the books change again.
+
+The counters, like the entries, must be shared by every server process:
+a write seen by the counters of one process only would leave the others
+answering 304 to stale lists. settings.CACHE_URL configures such a cache,
+and manage.py check --deploy fails without one (store.checks).
+
+Counters missing from the cache start from the clock rather than from 0,
+so they do not repeat a value that an ETag was derived from before the
+cache lost them.
+
+The async read views use the a*() versions of the lookups, on the async
+cache API.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'store:generation'
+LIST_VERSION_KEY = 'store:books:version'
+FACETS_VERSION_KEY = 'store:facets:version'
+STATS_KEY = 'store:cache:{kind}:{result}'
+STATS_KINDS = ('book', 'list', 'facets')
+QUOTE = '"'
+
+
+def _book_version_key(book_id):
+    return f'store:book:{book_id}:version'
+
+
+def _seed():
+    return time.time_ns() // 1000
+
+
+def _bump(*keys, start=_seed):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, start(), timeout=None)
+
+
+def _versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _seed(), timeout=None)
+            versions[key] = cache.get(key, 0)
+    return [versions[key] for key in keys]
+
+
+async def _abump(*keys, start=_seed):
+    for key in keys:
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, start(), timeout=None)
+
+
+async def _aversions(*keys):
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _seed(), timeout=None)
+            versions[key] = await cache.aget(key, 0)
+    return [versions[key] for key in keys]
+
+
+def invalidate_book(*book_ids):
+    keys = (*map(_book_version_key, book_ids), LIST_VERSION_KEY)
+    _bump(*keys)
+    transaction.on_commit(lambda: _bump(*keys))
+
+
+def invalidate_facets():
+    _bump(FACETS_VERSION_KEY)
+    transaction.on_commit(lambda: _bump(FACETS_VERSION_KEY))
+
+
+def invalidate_all():
+    _bump(GENERATION_KEY)
+    transaction.on_commit(lambda: _bump(GENERATION_KEY))
+
+
+def book_key(book_id, etag):
+    generation, version = _versions(GENERATION_KEY, _book_version_key(book_id))
+    return f'store:book:{book_id}:{generation}:{version}:{etag.strip(QUOTE)}'
+
+
+async def abook_key(book_id, etag):
+    generation, version = await _aversions(GENERATION_KEY, _book_version_key(book_id))
+    return f'store:book:{book_id}:{generation}:{version}:{etag.strip(QUOTE)}'
+
+
+def query_signature(request, *extra, only=None):
+    """Digest of host, path and the sorted query parameters (filters, search,
+    ordering, cursor and page size) of request, or only those named in only,
+    plus any extra values."""
+    params = sorted((name, value) for name, values in request.query_params.lists() for value in values
+                    if only is None or name in only)
+    return hashlib.sha1(repr((request.get_host(), request.path, params, *extra)).encode()).hexdigest()
+
+
+def list_etag(request):
+    """ETag of a list response: the query_signature() of request and of the
+    versions of the books, with no database query."""
+    return f'"{query_signature(request, *_versions(GENERATION_KEY, LIST_VERSION_KEY))}"'
+
+
+async def alist_etag(request):
+    return f'"{query_signature(request, *await _aversions(GENERATION_KEY, LIST_VERSION_KEY))}"'
+
+
+def list_key(etag):
+    return f'store:books:{etag.strip(QUOTE)}'
+
+
+def facets_key(request, params, *extra):
+    generation, version = _versions(GENERATION_KEY, FACETS_VERSION_KEY)
+    return f'store:facets:{generation}:{version}:{query_signature(request, *extra, only=params)}'
+
+
+def get_or_build(kind, key, build):
+    """Return (data, hit): the cached data under key, or build() stored
+    there. build() returns None for data that must not be cached."""
+    timeout = settings.STORE_CACHE_TIMEOUT
+    if not timeout:
+        return build(), False
+    data = cache.get(key)
+    hit = data is not None
+    if not hit:
+        data = build()
+        if data is not None:
+            cache.set(key, data, timeout)
+    _bump(STATS_KEY.format(kind=kind, result='hits' if hit else 'misses'), start=lambda: 1)
+    return data, hit
+
+
+async def aget_or_build(kind, key, build):
+    """get_or_build() for async views, build being a coroutine function."""
+    timeout = settings.STORE_CACHE_TIMEOUT
+    if not timeout:
+        return await build(), False
+    data = await cache.aget(key)
+    hit = data is not None
+    if not hit:
+        data = await build()
+        if data is not None:
+            await cache.aset(key, data, timeout)
+    await _abump(STATS_KEY.format(kind=kind, result='hits' if hit else 'misses'), start=lambda: 1)
+    return data, hit
+
+
+def _stats_keys():
+    return {(kind, result): STATS_KEY.format(kind=kind, result=result)
+            for kind in STATS_KINDS for result in ('hits', 'misses')}
+
+
+def cache_stats():
+    """Hits, misses and hit rate of each kind of cached response, counted in
+    the cache, so over all the server processes."""
+    keys = _stats_keys()
+    values = cache.get_many(keys.values())
+    report = {}
+    for kind in STATS_KINDS:
+        hits, misses = (values.get(keys[kind, result], 0) for result in ('hits', 'misses'))
+        lookups = hits + misses
+        report[kind] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / lookups, 3) if lookups else None}
+    return report
+
+
+def reset_cache_stats():
+    cache.delete_many(_stats_keys().values())
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The version counters of store.cache and the windows of books.routers
+    must be seen by every server process: a write handled by one process
+    would otherwise leave the others answering 304 to stale lists."""
+    if not (settings.STORE_CACHE_TIMEOUT or settings.DATABASE_REPLICAS):
+        return []
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_CACHES:
+        return []
+    return [Error(
+        'The default cache is local to each server process.',
+        hint='Set CACHE_URL to a Redis server shared by the server processes.',
+        id='store.E001',
+    )]
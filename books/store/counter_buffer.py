@@ -0,0 +1,127 @@
+"""Write-coalescing for book counters.
+
+With STORE_COUNTER_MODE = 'buffered' committed relation changes are not
+applied to their book straight away: their deltas are summed per book in
+memory and a background thread applies one UPDATE per book when
+STORE_COUNTER_FLUSH_SIZE books are pending or every
+STORE_COUNTER_FLUSH_INTERVAL seconds. Counters may therefore lag behind
+the relations by up to STORE_COUNTER_MAX_STALENESS seconds; if the worker
+falls further behind than that (or is not running), writers flush
+synchronously instead. Pending deltas live in this process only, so they
+are lost on a hard crash; check_book_ratings --fix repairs that.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from store.cache import invalidate_book
+from store.logic import apply_counter_deltas
+from store.models import Book
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self, flush_size, flush_interval, max_staleness):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='store-counter-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, book_id, deltas):
+        book_id = Book._meta.pk.to_python(book_id)
+        with self._lock:
+            self._pending.setdefault(book_id, Counter()).update(deltas)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            overdue = time.monotonic() - self._oldest > self.max_staleness
+            full = len(self._pending) >= self.flush_size
+        if overdue or not self.running:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Apply every pending delta, one UPDATE per book. Returns the number
+        of books updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._oldest = self._pending, {}, None
+            pending = {book_id: deltas for book_id, deltas in pending.items() if any(deltas.values())}
+            try:
+                with transaction.atomic():
+                    # Sorted, so concurrent flushes lock book rows in the same order.
+                    for book_id, deltas in sorted(pending.items()):
+                        apply_counter_deltas(book_id, {field: delta for field, delta in deltas.items() if delta})
+                        invalidate_book(book_id)
+            except Exception:
+                self._requeue(pending)
+                raise
+        return len(pending)
+
+    def _requeue(self, pending):
+        with self._lock:
+            for book_id, deltas in pending.items():
+                self._pending.setdefault(book_id, Counter()).update(deltas)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush book counters, will retry')
+        close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = CounterBuffer(
+                flush_size=settings.STORE_COUNTER_FLUSH_SIZE,
+                flush_interval=settings.STORE_COUNTER_FLUSH_INTERVAL,
+                max_staleness=settings.STORE_COUNTER_MAX_STALENESS,
+            )
+            _buffer.start()
+            atexit.register(_buffer.stop)
+        return _buffer
@@ -0,0 +1,57 @@
+"""Facet counts of a filtered book list: a histogram of prices in buckets
+of equal width and the authors with the most books. Each facet is one
+grouped query, which PostgreSQL answers from the price and author indexes
+when no search narrows the books down; both are sent as one UNION ALL
+statement.
+"""
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import Count, F, Value
+from django.db.models.functions import Floor
+
+PRICE, AUTHOR = 0, 1
+
+
+def book_facets(books, price_bucket, authors):
+    books = books.order_by()
+    buckets = books.annotate(bucket=Floor(F('price') / Value(price_bucket))).values('bucket').annotate(
+        count=Count('id'))
+    top_authors = books.values('author').annotate(count=Count('id')).order_by('-count', 'author')[:authors]
+
+    prices, author_counts = [], []
+    for facet, bucket, author, count in union_all(books.db, buckets, top_authors):
+        if facet == PRICE:
+            # SQLite returns the bucket as a float.
+            start = Decimal(bucket) * price_bucket
+            prices.append({'from': price_string(start), 'to': price_string(start + price_bucket), 'count': count})
+        else:
+            author_counts.append({'author': author, 'count': count})
+    return {
+        'count': sum(bucket['count'] for bucket in prices),
+        'price': prices,
+        'authors': author_counts,
+    }
+
+
+def union_all(using, buckets, top_authors):
+    """Rows of (facet, bucket, author, count) of both grouped queries, price
+    buckets first in bucket order, then the authors in the order of
+    top_authors. Each query is a derived table, so that the LIMIT of the
+    authors is allowed on SQLite as well."""
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    bucket, author, count = quote_name('bucket'), quote_name('author'), quote_name('count')
+    buckets_sql, buckets_params = buckets.query.get_compiler(using).as_sql()
+    authors_sql, authors_params = top_authors.query.get_compiler(using).as_sql()
+    sql = (f'SELECT {PRICE} AS facet, {bucket}, NULL AS {author}, {count} FROM ({buckets_sql}) AS buckets '
+           f'UNION ALL SELECT {AUTHOR}, NULL, {author}, {count} FROM ({authors_sql}) AS authors '
+           f'ORDER BY facet, {bucket}, {count} DESC, {author}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (*buckets_params, *authors_params))
+        return cursor.fetchall()
+
+
+def price_string(price):
+    # Prices are rendered like BookSerializer renders them.
+    return f'{price:.2f}'
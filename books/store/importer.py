@@ -0,0 +1,101 @@
+"""Bulk import of books from publisher feeds.
+
+Rows are read lazily from CSV or NDJSON, validated with BookImportSerializer
+and upserted chunk by chunk on the (name, author) natural key, so memory use
+does not depend on the size of the feed. Invalid
+rows are reported and skipped without aborting the rest of the import.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from rest_framework.exceptions import ValidationError
+
+from store.cache import invalidate_all
+from store.logic import touched
+from store.models import Book
+from store.serializers import BookImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+
+
+def read_rows(lines, format):
+    """Yield (row number, row) from an iterable of text lines. A row that
+    cannot be parsed is yielded as a ValidationError."""
+    if format == 'csv':
+        yield from enumerate(csv.DictReader(lines), start=1)
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, ValidationError(f'Invalid JSON: {exc}')
+
+
+def import_books(rows, owner=None, chunk_size=None, on_error=None):
+    """Create or update books from (row number, row) pairs and return the
+    number of created, updated, unchanged and invalid rows. Created books
+    belong to owner; on_error(row number, errors) is called for every
+    invalid row. A later row with the same name and author wins."""
+    chunk_size = chunk_size or settings.STORE_IMPORT_CHUNK_SIZE
+    counts = dict.fromkeys(('created', 'updated', 'unchanged', 'invalid'), 0)
+    serializer = BookImportSerializer()
+    chunk = {}
+    for number, row in rows:
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            data = serializer.run_validation(row)
+        except ValidationError as exc:
+            counts['invalid'] += 1
+            if on_error is not None:
+                on_error(number, exc.detail)
+            continue
+        chunk[data['name'], data.get('author', '')] = data
+        if len(chunk) >= chunk_size:
+            write_chunk(chunk, owner, counts)
+            chunk = {}
+    if chunk:
+        write_chunk(chunk, owner, counts)
+    return counts
+
+
+@transaction.atomic
+def write_chunk(chunk, owner, counts):
+    """Upsert the validated rows of chunk, keyed by (name, author). Rows
+    whose price did not change are not written at all; updated books get
+    their version bumped in their UPDATE, like any other change. The
+    existing rows are locked until the chunk commits. A book created by a
+    concurrent import after they were read keeps the price of that import.
+
+    The cached books are invalidated when the chunk commits, not at the end
+    of the import: bulk_create() and update() send no post_save."""
+    existing = {
+        (book['name'], book['author']): book
+        for book in Book.objects.select_for_update().filter(name__in={name for name, author in chunk}).order_by(
+            'pk').values('pk', 'name', 'author', 'price')
+    }
+    created, prices = [], {}
+    for key, data in chunk.items():
+        current = existing.get(key)
+        if current is None:
+            created.append(Book(owner=owner, **data))
+        elif current['price'] != data['price']:
+            prices[current['pk']] = data['price']
+        else:
+            counts['unchanged'] += 1
+    # Books inserted first by a concurrent import are skipped.
+    Book.objects.bulk_create(created, ignore_conflicts=True)
+    if prices:
+        Book.objects.filter(pk__in=prices).update(price=Case(
+            *(When(pk=pk, then=Value(price)) for pk, price in prices.items()),
+            output_field=Book._meta.get_field('price')), **touched())
+    counts['created'] += len(created)
+    counts['updated'] += len(prices)
+    if created or prices:
+        invalidate_all()
@@ -0,0 +1,106 @@
+"""Precomputed leaderboards of the top rated, most liked and most bookmarked
+books, of the whole catalogue and of every author.
+
+They are stored as LeaderboardEntry rows, so that reading one fetches at
+most STORE_LEADERBOARD_SIZE rows by index whatever the size of the
+catalogue. Books are ranked on their counters, which store.logic keeps
+equal to the aggregates of their UserBookRelation rows; only books with at
+least STORE_LEADERBOARD_MIN_VOTES ratings are ranked by rating.
+
+manage.py refresh_leaderboards brings them up to date and is meant to run
+periodically. It rebuilds the boards of the whole catalogue and those of
+the authors of books changed since the previous refresh. A deleted book
+leaves its place empty on the boards of its author until a --full refresh.
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from store.logic import batches
+from store.models import Book, LeaderboardEntry
+
+# The ordering of each board; ties go to the oldest book.
+BOARDS = {
+    'rating': ('-rating', '-ratings_count', 'id'),
+    'likes': ('-likes_count', 'id'),
+    'bookmarks': ('-bookmarks_count', 'id'),
+}
+
+# Changes are looked for from this long before the previous refresh, for
+# transactions still running at the time and for the clock differences
+# between the servers and the database.
+OVERLAP = timedelta(minutes=5)
+
+INSERT_BATCH_SIZE = 1000
+
+
+def ranked_books(board):
+    books = Book.objects.all()
+    if board == 'rating':
+        books = books.filter(ratings_count__gte=max(settings.STORE_LEADERBOARD_MIN_VOTES, 1))
+    elif board == 'likes':
+        books = books.filter(likes_count__gt=0)
+    elif board == 'bookmarks':
+        books = books.filter(bookmarks_count__gt=0)
+    return books.order_by(*BOARDS[board])
+
+
+def catalogue_entries(board, refreshed_at):
+    book_ids = ranked_books(board).values_list('pk', flat=True)[:settings.STORE_LEADERBOARD_SIZE]
+    return [LeaderboardEntry(board=board, position=position, book_id=book_id, refreshed_at=refreshed_at)
+            for position, book_id in enumerate(book_ids, 1)]
+
+
+def author_entries(board, refreshed_at, authors=None):
+    """Entries of the boards of authors, of every author for None, ranked
+    with one query per batch of authors."""
+    books = ranked_books(board).exclude(author='').annotate(position=Window(
+        RowNumber(), partition_by=F('author'), order_by=BOARDS[board],
+    )).filter(position__lte=settings.STORE_LEADERBOARD_SIZE).order_by()
+    for batch in [None] if authors is None else batches(sorted(authors)):
+        rows = books if batch is None else books.filter(author__in=batch)
+        for author, position, book_id in rows.values_list('author', 'position', 'pk'):
+            yield LeaderboardEntry(board=board, author=author, position=position, book_id=book_id,
+                                   refreshed_at=refreshed_at)
+
+
+@transaction.atomic
+def refresh_leaderboards(full=False):
+    """Rebuild the boards of the whole catalogue and of the authors whose
+    books changed since the previous refresh, or of every author when full
+    or on the first refresh. Returns the numbers of authors whose boards
+    were rebuilt and of entries written."""
+    refreshed_at = timezone.now()
+    last_refresh = None if full else LeaderboardEntry.objects.aggregate(last=Max('refreshed_at'))['last']
+    if last_refresh is None:
+        authors = None
+        LeaderboardEntry.objects.all().delete()
+    else:
+        changed = Book.objects.filter(updated_at__gte=last_refresh - OVERLAP)
+        # The authors of the changed books now and at the previous refresh.
+        authors = set(changed.values_list('author', flat=True))
+        authors.update(LeaderboardEntry.objects.filter(book__in=changed).values_list('author', flat=True))
+        authors.discard('')
+        # The board leads the (board, author, position) index.
+        LeaderboardEntry.objects.filter(board__in=BOARDS, author='').delete()
+        for batch in batches(sorted(authors)):
+            LeaderboardEntry.objects.filter(board__in=BOARDS, author__in=batch).delete()
+
+    def all_entries():
+        for board in BOARDS:
+            yield from catalogue_entries(board, refreshed_at)
+            yield from author_entries(board, refreshed_at, authors)
+
+    written = 0
+    rebuilt = set()
+    entries = all_entries()
+    while chunk := list(islice(entries, INSERT_BATCH_SIZE)):
+        LeaderboardEntry.objects.bulk_create(chunk)
+        written += len(chunk)
+        rebuilt.update(entry.author for entry in chunk if entry.author)
+    return {'authors': len(rebuilt if authors is None else authors), 'entries': written}
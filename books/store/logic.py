@@ -1,9 +1,241 @@
-from django.db.models import F, Sum, Avg
+from collections import defaultdict
 
-from store.models import UserBookRelation
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum, Avg, Count, Q, OuterRef, Subquery, Value, Case, When, FloatField
+from django.db.models.functions import Cast, Coalesce, Now
+
+from store.cache import invalidate_all, invalidate_book
+from store.models import Book, UserBookRelation
+
+
+COUNTER_AGGREGATES = {
+    'likes_count': Count('pk', filter=Q(like=True)),
+    'bookmarks_count': Count('pk', filter=Q(in_bookmark=True)),
+    # rate is never NULL, so every relation counts as a rating,
+    # exactly as Avg('rate') does.
+    'ratings_count': Count('pk'),
+    'ratings_sum': Sum('rate'),
+}
+
+
+def touched():
+    """UPDATE values marking books as changed, see Book.version."""
+    return {'version': F('version') + 1, 'updated_at': Now()}
 
 
 def set_rating(book):
+    """Recompute the rating of book from all its relations. Regular writes go
+    through update_book_counters; this full scan is kept for repairs."""
     rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg("rate")).get('rating')
     book.rating = rating
-    book.save()
\ No newline at end of file
+    Book.objects.filter(pk=book.pk).update(rating=rating, **touched())
+    invalidate_book(book.pk)
+
+
+def rating_expression(count_delta=0, sum_delta=0):
+    """Average rate after adding the deltas to the stored sum/count pair. Both
+    F() references see the pre-UPDATE values, so it can share one UPDATE with
+    the counter increments."""
+    return Case(
+        When(ratings_count__gt=-count_delta,
+             then=Cast(F('ratings_sum') + sum_delta, FloatField()) / (F('ratings_count') + count_delta)),
+        default=None,
+        output_field=Book._meta.get_field('rating'),
+    )
+
+
+def counter_deltas(old_values, new_values):
+    """Change of the book counters when a relation goes from old_values to
+    new_values; old_values is None on insert, new_values is None on delete."""
+    deltas = dict.fromkeys(COUNTER_AGGREGATES, 0)
+    for values, sign in ((old_values, -1), (new_values, 1)):
+        if values is None:
+            continue
+        deltas['likes_count'] += sign * int(values['like'])
+        deltas['bookmarks_count'] += sign * int(values['in_bookmark'])
+        deltas['ratings_count'] += sign
+        deltas['ratings_sum'] += sign * values['rate']
+    return deltas
+
+
+def update_book_counters(book_id, old_values, new_values):
+    update_books_counters({book_id: counter_deltas(old_values, new_values)})
+
+
+def update_books_counters(book_deltas):
+    """Apply the counter deltas of many books, given as {book_id: deltas}.
+    Books with equal deltas share one UPDATE."""
+    book_deltas = {book_id: {field: delta for field, delta in deltas.items() if delta}
+                   for book_id, deltas in book_deltas.items()}
+    book_deltas = {book_id: deltas for book_id, deltas in book_deltas.items() if deltas}
+    if not book_deltas:
+        return
+    if settings.STORE_COUNTER_MODE == 'buffered':
+        from store.counter_buffer import get_counter_buffer
+
+        def add():
+            counter_buffer = get_counter_buffer()
+            for book_id, deltas in book_deltas.items():
+                counter_buffer.add(book_id, deltas)
+
+        transaction.on_commit(add)
+        return
+
+    groups = defaultdict(list)
+    for book_id, deltas in book_deltas.items():
+        groups[tuple(sorted(deltas.items()))].append(book_id)
+    for deltas, book_ids in groups.items():
+        for batch in batches(book_ids):
+            Book.objects.filter(pk__in=batch).update(**counter_updates(dict(deltas)), **touched())
+
+
+def apply_counter_deltas(book_id, deltas):
+    Book.objects.filter(pk=book_id).update(**counter_updates(deltas), **touched())
+
+
+def counter_updates(deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if 'ratings_count' in deltas or 'ratings_sum' in deltas:
+        updates['rating'] = rating_expression(deltas.get('ratings_count', 0), deltas.get('ratings_sum', 0))
+    return updates
+
+
+def upsert_relation(user, book_id, values):
+    """Create or update the relation of user to a book, see upsert_relations().
+    Returns None if the book does not exist."""
+    relations = upsert_relations(user, {Book._meta.pk.to_python(book_id): values})
+    return relations[0] if relations else None
+
+
+def upsert_relations(user, items):
+    """Create or update the relations of user to many books, given as
+    {book_id: values}; fields missing from values keep their current value.
+    Must run inside a transaction.
+
+    The existing relations are read with a lock on their rows, so writers of
+    the same relation are serialized; the book rows are not locked, writers
+    of other users' relations to a book do not wait for each other. New
+    relations take one INSERT that skips missing books and rows created
+    first by concurrent transactions (see insert_relations()); those rows
+    are then read, locked and updated like the others. Relations that do not
+    change are skipped, and the book counters are updated once per book at
+    the end.
+
+    Returns the relations of the books that exist."""
+    relations = []
+    book_deltas = {}
+    for batch in batches(sorted(items)):
+        batch_relations, batch_deltas = upsert_relations_batch(user, batch, items)
+        relations += batch_relations
+        book_deltas.update(batch_deltas)
+
+    update_books_counters(book_deltas)
+    # Raw and bulk INSERTs send no post_save. Past a batch of books,
+    # one generation bump is cheaper than a version bump per book.
+    if len(book_deltas) > settings.STORE_RELATION_BULK_BATCH_SIZE:
+        invalidate_all()
+    elif book_deltas:
+        invalidate_book(*book_deltas)
+    return relations
+
+
+def upsert_relations_batch(user, book_ids, items):
+    """Upsert the relations of one batch of upsert_relations(). Returns the
+    relations and their book counter deltas."""
+    stored = locked_relations(user, book_ids)
+    created = [UserBookRelation(user=user, book_id=book_id, **items[book_id])
+               for book_id in book_ids if book_id not in stored]
+    inserted = insert_relations(created)
+    raced = [relation.book_id for relation in created if relation.book_id not in inserted]
+    if raced:
+        # The INSERT waited for the concurrent transactions that created
+        # these rows, so they are committed and can be locked now. Books
+        # found in neither query do not exist.
+        stored.update(locked_relations(user, raced))
+
+    relations, updated, book_deltas = [], [], {}
+    for relation in created:
+        if relation.book_id in inserted:
+            relation.pk = inserted[relation.book_id]
+            relation._counted_values = relation.counted_values()
+            relations.append(relation)
+            book_deltas[relation.book_id] = counter_deltas(None, relation._counted_values)
+    for book_id, row in stored.items():
+        old_values = {field: row[field] for field in UserBookRelation.COUNTED_FIELDS}
+        relation = UserBookRelation(pk=row['pk'], user=user, book_id=book_id, **{**old_values, **items[book_id]})
+        relation._counted_values = relation.counted_values()
+        relations.append(relation)
+        if relation._counted_values != old_values:
+            updated.append(relation)
+            book_deltas[book_id] = counter_deltas(old_values, relation._counted_values)
+    # One multi-row statement, where bulk_update() would build a CASE per
+    # row and field; the rows are locked, so it never inserts.
+    UserBookRelation.objects.bulk_create(updated, update_conflicts=True, unique_fields=['user', 'book'],
+                                         update_fields=UserBookRelation.COUNTED_FIELDS)
+    relations.sort(key=lambda relation: relation.book_id)
+    return relations, book_deltas
+
+
+def locked_relations(user, book_ids):
+    """Relations of user to the books, as {book_id: values}, locked in book
+    order."""
+    return {relation['book']: relation for relation in UserBookRelation.objects.select_for_update().filter(
+        user=user, book__in=book_ids).order_by('book').values('pk', 'book', *UserBookRelation.COUNTED_FIELDS)}
+
+
+def insert_relations(relations):
+    """INSERT the relations whose book exists and which no other transaction
+    created first, in one statement: ON CONFLICT DO NOTHING waits for a
+    concurrent INSERT of the same (user, book) instead of failing, so no
+    savepoint is needed. Returns {book_id: pk} of the inserted rows."""
+    if not relations:
+        return {}
+    quote_name = connection.ops.quote_name
+    meta = UserBookRelation._meta
+    fields = ('user', 'book', *UserBookRelation.COUNTED_FIELDS)
+    user_column, book_column = (quote_name(meta.get_field(name).column) for name in ('user', 'book'))
+    row = f'({", ".join(["%s"] * len(fields))})'
+    books = f'SELECT {quote_name(Book._meta.pk.column)} FROM {quote_name(Book._meta.db_table)}'
+    # column2, the book, is how PostgreSQL and SQLite both name the second
+    # column of VALUES.
+    sql = (f'INSERT INTO {quote_name(meta.db_table)} '
+           f'({", ".join(quote_name(meta.get_field(name).column) for name in fields)}) '
+           f'SELECT * FROM (VALUES {", ".join([row] * len(relations))}) AS relation '
+           f'WHERE relation.column2 IN ({books}) '
+           f'ON CONFLICT ({user_column}, {book_column}) DO NOTHING '
+           f'RETURNING {book_column}, {quote_name(meta.pk.column)}')
+    params = [getattr(relation, meta.get_field(name).attname) for relation in relations for name in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def batches(items, size=None):
+    size = size or settings.STORE_RELATION_BULK_BATCH_SIZE
+    return (items[start:start + size] for start in range(0, len(items), size))
+
+
+def touch_user_books(user):
+    """Mark the books that render user, as their owner or one of their
+    readers, as changed, after a change of the user's names."""
+    book_ids = list(Book.objects.filter(Q(owner=user) | Q(readers=user)).order_by('pk').values_list(
+        'pk', flat=True).distinct())
+    for batch in batches(book_ids):
+        Book.objects.filter(pk__in=batch).update(**touched())
+    if len(book_ids) > settings.STORE_RELATION_BULK_BATCH_SIZE:
+        invalidate_all()
+    elif book_ids:
+        invalidate_book(*book_ids)
+
+
+def rebuild_book_counters(books=None):
+    if books is None:
+        books = Book.objects.all()
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    updated = books.update(**{
+        field: Coalesce(Subquery(relations.annotate(value=aggregate).values('value')), Value(0))
+        for field, aggregate in COUNTER_AGGREGATES.items()
+    })
+    books.update(rating=rating_expression(), **touched())
+    return updated
@@ -0,0 +1,21 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the most similar books of every book from UserBookRelation rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, help='Neighbours kept per book, STORE_SIMILAR_BOOKS by default.')
+        parser.add_argument('--block-size', type=int, default=1000, help='Books compared with all others at a time.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help=f'Processes computing blocks, up to {os.cpu_count()} here.')
+
+    def handle(self, *args, **options):
+        counts = build_recommendations(top=options['top'], block_size=options['block_size'],
+                                       workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {counts["similarities"]} similarities of {counts["books"]} books'))
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import invalidate_all
+from store.logic import COUNTER_AGGREGATES, rebuild_book_counters
+from store.models import Book, UserBookRelation
+
+
+class Command(BaseCommand):
+    help = 'Compare stored book counters and ratings with a full recompute from UserBookRelation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--fix', action='store_true', help='Rebuild the books that differ.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ('pk', 'rating', *COUNTER_AGGREGATES)
+        # Backends round the stored rating differently, so allow half a unit
+        # in the last place.
+        tolerance = Decimal(1).scaleb(-Book._meta.get_field('rating').decimal_places) / 2
+        checked = 0
+        broken = []
+        last_pk = 0
+
+        while True:
+            batch = list(Book.objects.filter(pk__gt=last_pk).order_by('pk').values(*fields)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]['pk']
+            actual = {
+                row.pop('book'): row for row in UserBookRelation.objects
+                .filter(book__in=[book['pk'] for book in batch])
+                .order_by().values('book').annotate(**COUNTER_AGGREGATES)
+            }
+            for book in batch:
+                expected = actual.get(book['pk'], dict.fromkeys(COUNTER_AGGREGATES, 0))
+                diff = [f'{field} stored {book[field]} expected {value}'
+                        for field, value in expected.items() if book[field] != value]
+                rating = (Decimal(expected['ratings_sum']) / expected['ratings_count']
+                          if expected['ratings_count'] else None)
+                if self.rating_differs(book['rating'], rating, tolerance):
+                    diff.append(f'rating stored {book["rating"]} expected {rating and round(rating, 2)}')
+                if diff:
+                    broken.append(book['pk'])
+                    self.stdout.write(f'Book {book["pk"]}: ' + ', '.join(diff))
+            checked += len(batch)
+
+        self.stdout.write(f'Checked {checked} books, {len(broken)} inconsistent')
+        if broken and options['fix']:
+            with transaction.atomic():
+                rebuild_book_counters(Book.objects.filter(pk__in=broken))
+                invalidate_all()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(broken)} books'))
+
+    @staticmethod
+    def rating_differs(stored, expected, tolerance):
+        if stored is None or expected is None:
+            return stored is not expected
+        return abs(stored - expected) > tolerance
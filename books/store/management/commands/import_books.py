@@ -0,0 +1,47 @@
+import os
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import FORMATS, import_books, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update books from a CSV or NDJSON file, matched on name and author.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, - for stdin.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the extension of path.')
+        parser.add_argument('--owner', help='Username of the owner of created books.')
+        parser.add_argument('--chunk-size', type=int, help='Rows validated and written at a time.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}, use --format.')
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user {options["owner"]}.')
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            counts = import_books(read_rows(stream, format), owner=owner, chunk_size=options['chunk_size'],
+                                  on_error=self.report_error)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(
+            'Created {created}, updated {updated}, unchanged {unchanged} books; {invalid} invalid rows'.format(
+                **counts)))
+
+    def report_error(self, number, errors):
+        if isinstance(errors, dict):
+            message = '; '.join(f'{field}: {" ".join(map(str, messages))}' for field, messages in errors.items())
+        else:
+            message = ' '.join(map(str, errors))
+        self.stderr.write(f'Row {number}: {message}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import invalidate_all
+from store.logic import rebuild_book_counters
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute likes/bookmarks/ratings counters of books from UserBookRelation rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Only rebuild these books.')
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+        with transaction.atomic():
+            updated = rebuild_book_counters(books)
+            invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters of {updated} books'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.leaderboards import refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the book leaderboards that changed since the previous refresh.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild the boards of every author, which also drops deleted books from them.')
+
+    def handle(self, *args, **options):
+        counts = refresh_leaderboards(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the leaderboards of the catalogue and of {counts["authors"]} authors, '
+            f'{counts["entries"]} entries'))
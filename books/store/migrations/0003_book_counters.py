@@ -0,0 +1,58 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:54
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    aggregates = {
+        'likes_count': Count('pk', filter=Q(like=True)),
+        'bookmarks_count': Count('pk', filter=Q(in_bookmark=True)),
+        'ratings_count': Count('pk'),
+        'ratings_sum': Sum('rate'),
+    }
+    Book.objects.update(**{
+        field: Coalesce(Subquery(relations.annotate(value=aggregate).values('value')), Value(0))
+        for field, aggregate in aggregates.items()
+    })
+    # Ratings lost by the former read-modify-write updates are recomputed too.
+    Book.objects.update(rating=Case(
+        When(ratings_count__gt=0, then=Cast(F('ratings_sum'), FloatField()) / F('ratings_count')),
+        default=None,
+        output_field=Book._meta.get_field('rating'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_book_author_owner_rating_userbookrelation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='ratings_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
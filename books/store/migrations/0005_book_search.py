@@ -0,0 +1,79 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:15
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='store_book_search_vector'),
+    django.contrib.postgres.indexes.GinIndex(fields=['name'], name='store_book_name_trgm', opclasses=['gin_trgm_ops']),
+    django.contrib.postgres.indexes.GinIndex(fields=['author'], name='store_book_author_trgm', opclasses=['gin_trgm_ops']),
+]
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({table}.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({table}.author, '')), 'B')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION store_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(table='NEW')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, author ON store_book
+    FOR EACH ROW EXECUTE FUNCTION store_book_search_vector_update();
+
+UPDATE store_book SET search_vector = {SEARCH_VECTOR.format(table='store_book')};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER store_book_search_vector_update ON store_book;
+DROP FUNCTION store_book_search_vector_update();
+"""
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Book = apps.get_model('store', 'Book')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Book, index)
+    schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Book = apps.get_model('store', 'Book')
+    schema_editor.execute(DROP_TRIGGER)
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Book, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_book_version_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN indexes and the trigger only exist on PostgreSQL; other
+        # databases search through store.search's fallbacks.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[migrations.AddIndex(model_name='book', index=index) for index in SEARCH_INDEXES],
+            database_operations=[migrations.RunPython(create_search, drop_search)],
+        ),
+    ]
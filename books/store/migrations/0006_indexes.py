@@ -0,0 +1,70 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    """Keep the oldest relation of every (user, book) pair, then recount the
+    books that had duplicates."""
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    duplicates = UserBookRelation.objects.values('user', 'book').annotate(
+        first=Min('pk'), total=Count('pk')).filter(total__gt=1).order_by()
+    book_ids = set()
+    for duplicate in duplicates:
+        UserBookRelation.objects.filter(user=duplicate['user'], book=duplicate['book']).exclude(
+            pk=duplicate['first']).delete()
+        book_ids.add(duplicate['book'])
+    if not book_ids:
+        return
+
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    aggregates = {
+        'likes_count': Count('pk', filter=Q(like=True)),
+        'bookmarks_count': Count('pk', filter=Q(in_bookmark=True)),
+        'ratings_count': Count('pk'),
+        'ratings_sum': Sum('rate'),
+    }
+    Book.objects.filter(pk__in=book_ids).update(**{
+        field: Coalesce(Subquery(relations.annotate(value=aggregate).values('value')), Value(0))
+        for field, aggregate in aggregates.items()
+    })
+    for book in Book.objects.filter(pk__in=book_ids):
+        book.rating = round(book.ratings_sum / book.ratings_count, 2) if book.ratings_count else None
+        book.version += 1
+        book.save(update_fields=['rating', 'version', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_book_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'id'], name='store_book_author_id'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['book'], name='store_ubr_book_liked'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('in_bookmark', True)), fields=['book'], name='store_ubr_book_bookmarked'),
+        ),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_userbookrelation_user_book'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:26
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_books(apps, schema_editor):
+    """Books sharing a name and an author must be merged or renamed by hand
+    before the constraint can be added: which one keeps the name, and what
+    becomes of the readers of the others, is not for a migration to decide."""
+    Book = apps.get_model('store', 'Book')
+    duplicates = Book.objects.values('name', 'author').annotate(total=Count('pk')).filter(total__gt=1).order_by(
+        'name', 'author')
+    lines = []
+    for duplicate in duplicates:
+        ids = Book.objects.filter(name=duplicate['name'], author=duplicate['author']).order_by('pk').values_list(
+            'pk', flat=True)
+        lines.append(f'  {duplicate["name"]!r} by {duplicate["author"]!r}: ids {", ".join(map(str, ids))}')
+    if lines:
+        raise RuntimeError('Books share a name and an author, resolve them before migrating:\n' + '\n'.join(lines))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_books, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('name', 'author'), name='store_book_name_author'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_relation_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('rating', 'Top rated'), ('likes', 'Most liked'), ('bookmarks', 'Most bookmarked')], max_length=16)),
+                ('author', models.CharField(blank=True, default='', max_length=255)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refreshed_at'], name='store_leaderboard_refreshed')],
+                'constraints': [models.UniqueConstraint(fields=('board', 'author', 'position'), name='store_leaderboard_place')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_derived_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at'], name='store_book_updated_at'),
+        ),
+    ]
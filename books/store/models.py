@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 
 
 class Book(models.Model):
@@ -8,11 +10,73 @@ class Book(models.Model):
     author = models.CharField(max_length=255, default='')
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='my_books', null=True)
     readers = models.ManyToManyField(User, related_name='books', through='UserBookRelation')
-    rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True, editable=False)
+
+    # Denormalized counters maintained by store.logic.update_book_counters
+    # whenever a UserBookRelation is created, changed or deleted; rating is
+    # kept equal to ratings_sum / ratings_count by the same UPDATE. Like all
+    # the fields that are not editable, save() leaves them to their UPDATEs.
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    bookmarks_count = models.PositiveIntegerField(default=0, editable=False)
+    ratings_count = models.PositiveIntegerField(default=0, editable=False)
+    ratings_sum = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bumped on every change of the book's representation, including counter
+    # updates; they are the validators of the ETag/Last-Modified headers.
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Full-text document of name and author, kept current by a PostgreSQL
+    # trigger (see store.search); unused on other databases.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # Natural key of books, on which store.importer upserts them.
+            models.UniqueConstraint(fields=['name', 'author'], name='store_book_name_author'),
+        ]
+        indexes = [
+            # Keyset pagination of BookViewSet for each of its ordering_fields.
+            models.Index(fields=['price', 'id'], name='store_book_price_id'),
+            models.Index(fields=['author', 'id'], name='store_book_author_id'),
+            # Books changed since the last leaderboard refresh.
+            models.Index(fields=['updated_at'], name='store_book_updated_at'),
+            # PostgreSQL only, migration 0005 skips them elsewhere.
+            GinIndex(fields=['search_vector'], name='store_book_search_vector'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='store_book_name_trgm'),
+            GinIndex(fields=['author'], opclasses=['gin_trgm_ops'], name='store_book_author_trgm'),
+        ]
 
     def __str__(self):
         return f'Id {self.id}: {self.name}'
 
+    def save(self, *args, **kwargs):
+        """Save the book with its version bumped. A full save of an existing
+        book writes its editable fields only: the counters and the search
+        document are written by their own UPDATEs, which a stale instance
+        would otherwise undo. The version is bumped in the UPDATE too, from
+        the stored one, and read back."""
+        if not self._state.adding:
+            self.version = models.F('version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if field.editable and not field.primary_key]
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+            super().save(*args, **kwargs)
+            if hasattr(self.version, 'resolve_expression'):  # not returned by the UPDATE
+                self.refresh_from_db(using=self._state.db, fields=['version'])
+        else:
+            super().save(*args, **kwargs)
+
+    @property
+    def etag(self):
+        return book_etag(self.pk, self.version)
+
+
+def book_etag(book_id, version):
+    return f'"{book_id}-{version}"'
+
 
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
@@ -22,6 +86,7 @@ class UserBookRelation(models.Model):
         (4, 'Amazing'),
         (5, 'Incredible'),
     )
+    COUNTED_FIELDS = ('like', 'in_bookmark', 'rate')
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
@@ -29,17 +94,113 @@ class UserBookRelation(models.Model):
     in_bookmark = models.BooleanField(default=False)
     rate = models.PositiveIntegerField(choices=RATE_CHOICES, default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_userbookrelation_user_book'),
+        ]
+        indexes = [
+            models.Index(fields=['book'], condition=models.Q(like=True), name='store_ubr_book_liked'),
+            models.Index(fields=['book'], condition=models.Q(in_bookmark=True), name='store_ubr_book_bookmarked'),
+            # Filters of the admin changelist, which orders by id.
+            models.Index(fields=['id'], condition=models.Q(like=True), name='store_ubr_liked_id'),
+            models.Index(fields=['id'], condition=models.Q(in_bookmark=True), name='store_ubr_bookmarked_id'),
+            models.Index(fields=['rate', 'id'], name='store_ubr_rate_id'),
+        ]
+
     def __str__(self):
         return f' {self.user.username}: {self.book.name}, {self.rate}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the book counters accounted for when the row was loaded, for
+        # the post_delete handler; save() reads the row again under a lock.
+        if set(cls.COUNTED_FIELDS).issubset(field_names):
+            instance._counted_values = instance.counted_values()
+        return instance
+
+    def counted_values(self):
+        return {field: getattr(self, field) for field in self.COUNTED_FIELDS}
+
     def save(self, *args, **kwargs):
-        from store.logic import set_rating
-        creating = not self.pk
-        old_rating = self.rate
+        """Save the relation and apply the change to the counters of its
+        book. The stored row is read and locked first, so that concurrent
+        saves of the same relation each apply their own difference; a
+        relation moved to another book is removed from the counters of the
+        old book and added to those of the new one."""
+        from store.cache import invalidate_book
+        from store.logic import update_book_counters
+
+        with transaction.atomic(using=kwargs.get('using')):
+            stored = None
+            if self.pk is not None:
+                stored = UserBookRelation.objects.select_for_update().filter(pk=self.pk).values(
+                    'book', *self.COUNTED_FIELDS).first()
+            super().save(*args, **kwargs)
+            new_values = self.counted_values()
+            new_book_id = self.book_id
+            if stored is None:
+                update_book_counters(new_book_id, None, new_values)
+            else:
+                old_book_id = stored.pop('book')
+                update_fields = kwargs.get('update_fields')
+                if update_fields is not None:
+                    new_values = {field: new_values[field] if field in update_fields else stored[field]
+                                  for field in self.COUNTED_FIELDS}
+                    if 'book' not in update_fields and 'book_id' not in update_fields:
+                        new_book_id = old_book_id
+                if new_book_id == old_book_id:
+                    update_book_counters(new_book_id, stored, new_values)
+                else:
+                    update_book_counters(old_book_id, stored, None)
+                    update_book_counters(new_book_id, None, new_values)
+                    invalidate_book(old_book_id)
+
+        self._counted_values = new_values
+
+
+class LeaderboardEntry(models.Model):
+    """A place on a leaderboard precomputed by store.leaderboards."""
+    BOARDS = (
+        ('rating', 'Top rated'),
+        ('likes', 'Most liked'),
+        ('bookmarks', 'Most bookmarked'),
+    )
 
-        super().save(*args, **kwargs)
+    board = models.CharField(max_length=16, choices=BOARDS)
+    # The author of the books on the board, '' for the whole catalogue.
+    author = models.CharField(max_length=255, default='', blank=True)
+    position = models.PositiveSmallIntegerField()
+    # Deleting a book leaves its entries behind rather than costing deletes;
+    # the inner join of the leaderboard query skips them until the next
+    # rebuild of their board.
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    refreshed_at = models.DateTimeField()
 
-        new_rating = self.rate
-        if creating:
-            set_rating(self.book)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'author', 'position'], name='store_leaderboard_place'),
+        ]
+        indexes = [
+            models.Index(fields=['refreshed_at'], name='store_leaderboard_refreshed'),
+        ]
 
+    def __str__(self):
+        return f'{self.board} {self.author or "*"} #{self.position}: {self.book_id}'
+
+
+class BookSimilarity(models.Model):
+    """A neighbour of a book computed by store.recommendations, rank 1 being
+    the most similar. Like LeaderboardEntry, rows of deleted books are left
+    for the next build to drop."""
+    pk = models.CompositePrimaryKey('book', 'rank')
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    similar = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                related_name='+')
+    # Cosine similarity of the interests of their readers, in (0, 1].
+    score = models.FloatField()
+
+    def __str__(self):
+        return f'{self.book_id} #{self.rank}: {self.similar_id} ({self.score:.3f})'
@@ -0,0 +1,146 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Cursor pagination whose position holds the values of every ordering
+    field, with the primary key appended as a tiebreaker. Pages are fetched
+    with a WHERE (field, pk) > (value, last_pk) style filter, so they never
+    need an OFFSET and cost the same however deep the client pages, also
+    when ordering by a non-unique field such as price."""
+    ordering = ('pk',)
+    tiebreaker = 'pk'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        names = {order.lstrip('-') for order in ordering}
+        if not names & {'pk', queryset.model._meta.pk.name}:
+            # Same direction as the last field, so that a (field, id) index
+            # can be walked backwards for descending orderings.
+            descending = ordering[-1].startswith('-')
+            ordering += ('-' + self.tiebreaker if descending else self.tiebreaker,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        return None if queryset is None else self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() on the async ORM."""
+        queryset = self.page_queryset(queryset, request, view)
+        return None if queryset is None else self.set_page([row async for row in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """The rows of the requested page plus the first of the following
+        one, or None if pagination is disabled."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.after_position(queryset, ordering, current_position))
+        self.offset, self.reverse, self.current_position = offset, reverse, current_position
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        """Keep the page out of the results of page_queryset() and return it."""
+        offset, reverse, current_position = self.offset, self.reverse, self.current_position
+        self.page = list(results[:self.page_size])
+        has_following_position = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following_position else None
+        )
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def after_position(self, queryset, ordering, position):
+        """Q matching the rows of queryset that come after position in ordering."""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            values = [self._field(queryset, order).to_python(value) for order, value in zip(ordering, values)]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        after = Q()
+        equal = Q()
+        for order, value in zip(ordering, values):
+            name = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            after |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return after
+
+    @staticmethod
+    def _field(queryset, order):
+        name = order.lstrip('-')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        opts = queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            name = order.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(str(value))
+        return json.dumps(values)
+
+
+class StorePagination(KeysetCursorPagination):
+    """Pages of STORE_BOOK_PAGE_SIZE rows, or up to STORE_BOOK_MAX_PAGE_SIZE
+    with ?page_size=. The settings are read on every request, the way DRF
+    reads api_settings, so that they can change after import."""
+    ordering = ('id',)
+    tiebreaker = 'id'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = settings.STORE_BOOK_PAGE_SIZE
+        self.max_page_size = settings.STORE_BOOK_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+
+class BookPagination(StorePagination):
+    pass
+
+
+class ReaderPagination(StorePagination):
+    def get_ordering(self, request, queryset, view):
+        # Readers are always in id order: the ordering filter of the view
+        # applies to its books.
+        return self.ordering
@@ -2,9 +2,10 @@ from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
 class IsOwnerOrStaffOrReadOnly(BasePermission):
+    # Compares owner_id, so that checking needs no query for the owner.
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
             request.user and
-            request.user.is_authenticated and (obj.owner == request.user or request.user.is_staff)
+            request.user.is_authenticated and (obj.owner_id == request.user.pk or request.user.is_staff)
         )
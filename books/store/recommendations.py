@@ -0,0 +1,70 @@
+"""'Readers also liked' recommendations: the books most similar to each book,
+stored as BookSimilarity rows by manage.py build_recommendations and served
+by /book/{id}/similar/.
+
+A reader's interest in a book is 1 for a like, plus 0.5 for a bookmark,
+plus rate / 5. Two books are similar when the same readers are interested in
+them: their similarity is the cosine of their vectors of interests (see
+store.similarity). Each build replaces all the rows in one transaction.
+"""
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from store import similarity
+from store.models import BookSimilarity, UserBookRelation
+
+READ_CHUNK_SIZE = 10000
+INSERT_BATCH_SIZE = 5000
+
+
+def read_interests():
+    """Book ids, reader ids and interests of all relations as arrays, read
+    through a server-side cursor."""
+    relations = UserBookRelation.objects.order_by().values_list(
+        'book_id', 'user_id', 'like', 'in_bookmark', 'rate').iterator(chunk_size=READ_CHUNK_SIZE)
+    chunks = []
+    while chunk := list(islice(relations, READ_CHUNK_SIZE)):
+        chunks.append(np.array(chunk, dtype=np.int64).reshape(-1, 5))
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 5), np.int64)
+    interests = rows[:, 2] + rows[:, 3] * 0.5 + rows[:, 4] / 5
+    return rows[:, 0], rows[:, 1], interests
+
+
+def insert_sql():
+    """INSERT of a (book_id, rank, similar_id, score) row. Builds write
+    millions of them, without the cost of model instances."""
+    quote_name = connection.ops.quote_name
+    columns = [BookSimilarity._meta.get_field(name).column for name in ('book', 'rank', 'similar', 'score')]
+    return (f'INSERT INTO {quote_name(BookSimilarity._meta.db_table)} '
+            f'({", ".join(map(quote_name, columns))}) VALUES (%s, %s, %s, %s)')
+
+
+def build_recommendations(top=None, block_size=1000, workers=1):
+    """Recompute the top neighbours of every book with relations. Returns the
+    numbers of books and of similarities stored."""
+    top = top or settings.STORE_SIMILAR_BOOKS
+
+    book_ids, user_ids, interests = read_interests()
+    books, book_rows = np.unique(book_ids, return_inverse=True)
+    users, user_columns = np.unique(user_ids, return_inverse=True)
+    matrix = similarity.interest_matrix(book_rows, user_columns, interests, (len(books), len(users)))
+
+    def similarities():
+        for rows, neighbours, scores in similarity.top_neighbours(matrix, top, block_size, workers):
+            # Rows come ordered, so a rank is the distance to the first
+            # neighbour of the same book.
+            ranks = np.arange(len(rows)) - np.searchsorted(rows, rows) + 1
+            yield from zip(books[rows].tolist(), ranks.tolist(), books[neighbours].tolist(), scores.tolist())
+
+    sql = insert_sql()
+    stored = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        BookSimilarity.objects.all().delete()
+        rows = similarities()
+        while batch := list(islice(rows, INSERT_BATCH_SIZE)):
+            cursor.executemany(sql, batch)
+            stored += len(batch)
+    return {'books': len(books), 'similarities': stored}
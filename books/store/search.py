@@ -0,0 +1,127 @@
+"""Full-text search of books by name and author.
+
+BookSearchFilter is a drop-in replacement for SearchFilter: it keeps the
+`search` query parameter and its term splitting, but matches and ranks
+books through a database-specific backend instead of ILIKE '%term%' on
+every column:
+
+* PostgreSQL: the trigger-maintained search_vector column and its GIN
+  index, with trigram similarity (GIN gin_trgm_ops indexes on name and
+  author) catching misspellings;
+* SQLite: an FTS5 external-content table, store_book_fts, kept in sync
+  by triggers that ensure_sqlite_fts() creates after every migrate;
+* anything else: SearchFilter's own ILIKE lookups.
+
+Every backend prefix-matches each term and requires all of them, like
+SearchFilter, and annotates the results with search_rank (higher is more
+relevant). BookOrderingFilter orders by it when searching without an
+explicit ?ordering=.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Greatest
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+SEARCH_CONFIG = 'simple'
+RANK = 'search_rank'
+
+_WORD = re.compile(r'\w+')
+
+
+def search_words(terms):
+    """Alphanumeric words of the terms, safe to splice into tsquery and FTS5
+    query syntax."""
+    return [word for term in terms for word in _WORD.findall(term)]
+
+
+class PostgresBookSearch:
+    # A misspelt word matches through the %> operator, which the trigram
+    # indexes serve, at pg_trgm.word_similarity_threshold (0.6 by default).
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+        words = search_words(terms)
+        if not words:
+            return queryset.none()
+        phrase = ' '.join(words)
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+        similarity = Greatest(TrigramWordSimilarity(phrase, 'name'), TrigramWordSimilarity(phrase, 'author'))
+        # ts_rank() and similarities are real: a float4 does not survive the
+        # str()/to_python() round trip of a keyset cursor, a double does.
+        return queryset.annotate(
+            **{RANK: Cast(SearchRank(F('search_vector'), query) + similarity, FloatField())}
+        ).filter(
+            Q(search_vector=query)
+            | Q(name__trigram_word_similar=phrase) | Q(author__trigram_word_similar=phrase)
+        )
+
+
+class SqliteBookSearch:
+    table = 'store_book_fts'
+
+    def search(self, queryset, terms):
+        words = search_words(terms)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        book_table = queryset.model._meta.db_table
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', (match,))
+        ).annotate(**{RANK: RawSQL(
+            # bm25() is lower for better matches.
+            f'SELECT -bm25({self.table}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "{book_table}"."id"',
+            (match,), output_field=FloatField(),
+        )})
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresBookSearch,
+    'sqlite': SqliteBookSearch,
+}
+
+
+def ensure_sqlite_fts(connection):
+    """Create the FTS5 table and its triggers if missing and rebuild the
+    index. SQLite migrations that alter store_book recreate the table, which
+    drops its triggers, so this runs after every migrate."""
+    table = SqliteBookSearch.table
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} "
+        f"USING fts5(name, author, content='store_book', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON store_book BEGIN "
+        f"INSERT INTO {table}(rowid, name, author) VALUES (new.id, new.name, new.author); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON store_book BEGIN "
+        f"INSERT INTO {table}({table}, rowid, name, author) VALUES ('delete', old.id, old.name, old.author); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF name, author ON store_book BEGIN "
+        f"INSERT INTO {table}({table}, rowid, name, author) VALUES ('delete', old.id, old.name, old.author); "
+        f"INSERT INTO {table}(rowid, name, author) VALUES (new.id, new.name, new.author); END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class BookSearchFilter(SearchFilter):
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        backend = SEARCH_BACKENDS.get(connections[queryset.db].vendor)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        return backend().search(queryset, terms)
+
+
+class BookOrderingFilter(OrderingFilter):
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and RANK in queryset.query.annotations:
+            return [f'-{RANK}']
+        return super().get_ordering(request, queryset, view)
@@ -1,28 +1,242 @@
+import decimal
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import F
+from django.core.exceptions import ValidationError
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
 
-from store.models import Book, UserBookRelation
+from books.profiling import ProfiledListSerializer, ProfiledSerializerMixin
+from store.models import Book, LeaderboardEntry, UserBookRelation
 
 
-class BookReaderSerializer(serializers.ModelSerializer):
+class BookReaderSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name')
+        list_serializer_class = ProfiledListSerializer
 
 
-class BookSerializer(serializers.ModelSerializer):
-    annotated_like = serializers.IntegerField(read_only=True)
+class BookSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    annotated_like = serializers.IntegerField(source='likes_count', read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(source='owner.username', read_only=True, default='')
-    readers = BookReaderSerializer(many=True, read_only=True)
+    # Every relation carries a rate, so the number of ratings is the number
+    # of readers.
+    readers_count = serializers.IntegerField(source='ratings_count', read_only=True)
+    readers = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = ('id', 'name', 'price', 'author', 'annotated_like', 'rating', 'owner_name', 'readers')
+        fields = ('id', 'name', 'price', 'author', 'annotated_like', 'rating', 'owner_name', 'readers_count',
+                  'readers')
+        list_serializer_class = ProfiledListSerializer
+
+    def get_readers(self, book):
+        # BookViewSet prefetches only the first readers into readers_preview.
+        readers = getattr(book, 'readers_preview', None)
+        if readers is None:
+            readers = book.readers.all()
+        return BookReaderSerializer(readers, many=True).data
+
+
+class RowAccessors:
+    """The fields of a ModelSerializer resolved once into (key, values()
+    name, conversion) accessors, turning rows of .values() into the same
+    dicts as the serializer without DRF's per-field attribute lookups and
+    checks. Only fields with a model field or dotted source are supported;
+    others must be excluded and added by the caller."""
+
+    def __init__(self, serializer_class, exclude=()):
+        self.accessors = []
+        for name, field in serializer_class().fields.items():
+            if name in exclude:
+                continue
+            # A missing related object gives the field default, like
+            # Field.get_attribute() does.
+            default = None
+            if '.' in field.source and field.default is not empty:
+                default = field.default
+            self.accessors.append((name, field.source.replace('.', '__'), self.converter(field), default))
+        self.values = tuple(source for name, source, convert, default in self.accessors)
+
+    @staticmethod
+    def converter(field):
+        if isinstance(field, serializers.CharField):
+            return str
+        if isinstance(field, serializers.IntegerField):
+            return int
+        if (isinstance(field, serializers.DecimalField) and field.decimal_places is not None
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+                and not field.normalize_output and not field.localize):
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            exponent = decimal.Decimal('.1') ** field.decimal_places
+            rounding = field.rounding
+
+            def decimal_string(value):
+                if not isinstance(value, decimal.Decimal):
+                    value = decimal.Decimal(str(value).strip())
+                return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+
+            return decimal_string
+        return field.to_representation
+
+    def to_representation(self, row):
+        data = {}
+        for name, source, convert, default in self.accessors:
+            value = row[source]
+            data[name] = default if value is None else convert(value)
+        return data
+
+
+class BookRowsSerializer(ProfiledSerializerMixin, serializers.BaseSerializer):
+    """Fast read-only path of BookSerializer(many=True) for list pages:
+    books are fetched with .values() (see values()) and their readers
+    preview with one windowed query, and the output is the same JSON, byte
+    for byte."""
+    book = RowAccessors(BookSerializer, exclude=('readers',))
+    reader = RowAccessors(BookReaderSerializer)
+
+    @classmethod
+    def values(cls, queryset):
+        # Annotations such as the search rank stay available for ordering
+        # and keyset positions.
+        return queryset.select_related(None).prefetch_related(None).values(
+            *cls.book.values, *queryset.query.annotations)
+
+    def to_representation(self, rows):
+        # Async views fetch the readers beforehand, see areaders_preview().
+        readers = self.context.get('readers')
+        if readers is None:
+            readers = self.readers_preview([row['id'] for row in rows])
+        return [{**self.book.to_representation(row), 'readers': readers.get(row['id'], [])} for row in rows]
+
+    @classmethod
+    def readers_preview(cls, book_ids):
+        """The first readers of each book, by user id, as BookViewSet
+        prefetches them into readers_preview."""
+        return cls.group_readers(cls.readers_preview_relations(book_ids))
+
+    @classmethod
+    async def areaders_preview(cls, book_ids):
+        return cls.group_readers([relation async for relation in cls.readers_preview_relations(book_ids).aiterator()])
+
+    @classmethod
+    def readers_preview_relations(cls, book_ids):
+        return UserBookRelation.objects.filter(book__in=book_ids).annotate(
+            position=Window(RowNumber(), partition_by=F('book'), order_by=F('user_id').asc()),
+        ).filter(position__lte=settings.STORE_BOOK_READERS_PREVIEW).order_by('book', 'user_id').values(
+            'book', **{name: F(f'user__{name}') for name in cls.reader.values})
+
+    @classmethod
+    def group_readers(cls, relations):
+        readers = {}
+        for relation in relations:
+            readers.setdefault(relation['book'], []).append(cls.reader.to_representation(relation))
+        return readers
+
+
+class BookImportSerializer(BookSerializer):
+    """Validates the rows of store.importer. Existing (name, author) pairs
+    are updated there, so the uniqueness validator is left out."""
+
+    class Meta(BookSerializer.Meta):
+        fields = ('name', 'price', 'author')
+        validators = []
+
+
+def book_id(value):
+    """value as a Book primary key, or None if it cannot be one."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return Book._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+class BookRelatedField(serializers.PrimaryKeyRelatedField):
+    """Takes the books from context['books'] when they were loaded for a
+    whole list at once, see UserBookRelationListSerializer."""
 
+    def to_internal_value(self, data):
+        books = self.context.get('books')
+        if books is None:
+            return super().to_internal_value(data)
+        pk = book_id(data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in books:
+            self.fail('does_not_exist', pk_value=data)
+        return books[pk]
+
+
+class UserBookRelationListSerializer(ProfiledListSerializer):
+    """Validates the relations of many books with one query for all the
+    books instead of one per item, and rejects repeated books."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            pks = {book_id(item.get('book')) for item in data if isinstance(item, dict)} - {None}
+            self.context['books'] = Book.objects.only('id').in_bulk(pks)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        books = [item['book'].pk for item in attrs]
+        if len(set(books)) != len(books):
+            raise serializers.ValidationError('Each book may appear only once.')
+        return attrs
+
+
+class UserBookRelationSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    book = BookRelatedField(queryset=Book.objects.all())
 
-class UserBookRelationSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserBookRelation
-        fields = ('book', 'like', 'in_bookmark', 'rate')
\ No newline at end of file
+        fields = ('book', 'like', 'in_bookmark', 'rate')
+        list_serializer_class = UserBookRelationListSerializer
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    author = serializers.CharField(required=False, default='', allow_blank=True)
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_limit(self, limit):
+        return min(limit, settings.STORE_LEADERBOARD_SIZE)
+
+
+class FacetQuerySerializer(serializers.Serializer):
+    price_bucket = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=1, required=False)
+    authors = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_authors(self, authors):
+        return min(authors, settings.STORE_FACET_MAX_AUTHORS)
+
+
+class BookSummarySerializer(BookSerializer):
+    """A book without its owner and readers, for leaderboards and similar books."""
+
+    class Meta(BookSerializer.Meta):
+        fields = ('id', 'name', 'price', 'author', 'annotated_like', 'bookmarks_count', 'rating', 'readers_count')
+
+
+class LeaderboardEntrySerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    book = BookSummarySerializer()
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ('position', 'book')
+        list_serializer_class = ProfiledListSerializer
+
+
+class BookSimilaritySerializer(ProfiledSerializerMixin, serializers.Serializer):
+    score = serializers.FloatField()
+    book = BookSummarySerializer(source='similar')
+
+    class Meta:
+        list_serializer_class = ProfiledListSerializer
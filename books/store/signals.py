@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from store.cache import invalidate_book, invalidate_facets
+from store.logic import touch_user_books, update_book_counters
+from store.models import Book, UserBookRelation
+from store.search import ensure_sqlite_fts
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def relation_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Book) and origin.pk == instance.book_id:
+        return  # the book goes too, its counters do not matter
+    old_values = getattr(instance, '_counted_values', None) or instance.counted_values()
+    update_book_counters(instance.book_id, old_values, None)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    invalidate_book(instance.pk)
+    invalidate_facets()
+
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def relation_changed(sender, instance, **kwargs):
+    invalidate_book(instance.book_id)
+
+
+# The user fields that BookSerializer renders.
+RENDERED_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # Logins save last_login only. Deleting an owner sets Book.owner to
+    # NULL in a bulk UPDATE, which does not touch the books.
+    if created or (update_fields is not None and not RENDERED_USER_FIELDS & set(update_fields)):
+        return
+    touch_user_books(instance)
+
+
+def create_search_index(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and 'store_book' in connection.introspection.table_names():
+        ensure_sqlite_fts(connection)
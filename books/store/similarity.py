@@ -0,0 +1,80 @@
+"""Item-to-item cosine similarity of books, computed for store.recommendations.
+
+The books are the rows of a sparse book x reader matrix of interests. With
+the rows scaled to unit length, the cosine similarities of a block of books
+with all the others are one sparse matrix product, from which the top
+neighbours of each book of the block are picked. Blocks keep the memory
+bounded by the block size instead of the square of the catalogue, and can
+be spread over worker processes.
+
+This module does not use Django, so that workers can import it whatever the
+multiprocessing start method.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from scipy import sparse
+
+# The matrices of a worker process, set once by init_worker().
+_matrices = None
+
+
+def interest_matrix(rows, columns, values, shape):
+    """CSR matrix of the values at (rows, columns), repeated entries summed,
+    with every row scaled to unit length."""
+    matrix = sparse.csr_matrix((values, (rows, columns)), shape=shape, dtype=np.float64)
+    matrix.sum_duplicates()
+    lengths = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix.data /= np.repeat(lengths, np.diff(matrix.indptr))
+    return matrix
+
+
+def block_neighbours(matrix, transposed, start, stop, top):
+    """The top most similar other rows of rows start to stop, as arrays of
+    rows, neighbours and similarities ordered by row then similarity."""
+    block = (matrix[start:stop] @ transposed).tocsr()
+    rows, neighbours, scores = [], [], []
+    for row in range(block.shape[0]):
+        begin, end = block.indptr[row], block.indptr[row + 1]
+        columns, values = block.indices[begin:end], block.data[begin:end]
+        other = columns != start + row
+        columns, values = columns[other], values[other]
+        if len(values) > top:
+            # Ties with the last kept value go to the lowest columns.
+            best = values >= np.partition(values, len(values) - top)[len(values) - top]
+            columns, values = columns[best], values[best]
+        order = np.lexsort((columns, -values))[:top]
+        rows.append(np.full(len(order), start + row))
+        neighbours.append(columns[order])
+        scores.append(values[order])
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    # Rounding can take the cosine of parallel rows just above 1.
+    return np.concatenate(rows), np.concatenate(neighbours), np.minimum(np.concatenate(scores), 1)
+
+
+def init_worker(matrix, transposed):
+    global _matrices
+    _matrices = matrix, transposed
+
+
+def worker_block_neighbours(start, stop, top):
+    return block_neighbours(*_matrices, start, stop, top)
+
+
+def top_neighbours(matrix, top, block_size=1000, workers=1):
+    """Yield the block_neighbours() of every block of block_size rows of an
+    interest_matrix(), in order, computed by workers processes."""
+    transposed = matrix.T.tocsr()
+    starts = range(0, matrix.shape[0], block_size)
+    stops = [min(start + block_size, matrix.shape[0]) for start in starts]
+    if workers <= 1:
+        for start, stop in zip(starts, stops):
+            yield block_neighbours(matrix, transposed, start, stop, top)
+        return
+    # Spawned workers inherit none of the database connections of the parent.
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(matrix, transposed)) as executor:
+        yield from executor.map(worker_block_neighbours, starts, stops, repeat(top))
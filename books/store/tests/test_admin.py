@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.admin import EstimatedCountPaginator
+from store.models import Book, UserBookRelation
+
+
+class AdminChangelistTestCase(TestCase):
+    """Changelist pages cost the same few queries whatever the size of the
+    tables: no query per row and, on large tables, no COUNT(*)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='9900')
+        users = User.objects.bulk_create(User(username=f'reader {i}') for i in range(100))
+        books = Book.objects.bulk_create(Book(name=f'Book {i}', price=i % 50, author=f'Author {i % 30}', owner=users[i])
+                                         for i in range(100))
+        UserBookRelation.objects.bulk_create(
+            UserBookRelation(user=user, book=book, like=book.id % 2 == 0, rate=user.id % 5 + 1)
+            for user in users for book in books)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        url = reverse(f'admin:store_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(200, response.status_code)
+        return response, queries
+
+    def test_relations(self):
+        self.assertEqual(10000, UserBookRelation.objects.count())
+        response, queries = self.changelist('userbookrelation')
+        self.assertEqual(100, len(response.context['cl'].result_list))
+        self.assertContains(response, 'reader 99')
+        # Session, user, count and the page joined with books and users.
+        self.assertEqual(4, len(queries), [query['sql'] for query in queries])
+
+    def test_relation_filters(self):
+        response, queries = self.changelist('userbookrelation', like__exact=1, rate__exact=5)
+        self.assertEqual(1000, response.context['cl'].result_count)
+        self.assertEqual(4, len(queries), [query['sql'] for query in queries])
+
+    def test_books(self):
+        response, queries = self.changelist('book')
+        self.assertContains(response, 'reader 99')
+        self.assertEqual(4, len(queries), [query['sql'] for query in queries])
+
+    def test_estimated_count(self):
+        relations = UserBookRelation.objects.order_by('-pk')
+        with mock.patch('store.admin.estimated_count', return_value=2_000_000):
+            self.assertEqual(2_000_000, EstimatedCountPaginator(relations, 100).count)
+        # Small estimates are not worth the imprecision.
+        with mock.patch('store.admin.estimated_count', return_value=500):
+            self.assertEqual(10000, EstimatedCountPaginator(relations, 100).count)
+
+
+class AdminChangeFormTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='9900'))
+        self.owner = User.objects.create(username='owner')
+        self.book = Book.objects.create(name='Book', price=10, author='Author', owner=self.owner)
+        self.url = reverse('admin:store_book_change', args=(self.book.id,))
+
+    def test_counters_not_posted(self):
+        form = self.client.get(self.url).context['adminform'].form
+        self.assertEqual({'name', 'price', 'author', 'owner'}, set(form.fields))
+
+        # A like between the display of the form and its submission.
+        UserBookRelation.objects.create(user=User.objects.create(username='reader'), book=self.book, like=True)
+        version = Book.objects.get(pk=self.book.pk).version
+        response = self.client.post(self.url, {'name': 'Book', 'price': '12.00', 'author': 'Author',
+                                               'owner': self.owner.id})
+        self.assertEqual(302, response.status_code)
+        self.book.refresh_from_db()
+        self.assertEqual((12, 1, 1, version + 1),
+                         (self.book.price, self.book.likes_count, self.book.ratings_count, self.book.version))
@@ -1,19 +1,27 @@
 import json
+from decimal import Decimal
+import threading
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db.migrations import serializer
-from django.db.models import Count, Case, When, Avg
+from django.db import connection
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
+from store import logic
 from store.models import Book, UserBookRelation
 from store.serializers import BookSerializer
 
 
 class BooksApiTestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='admin', password='9900')
         self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1', owner=self.user)
         self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2', owner=self.user)
@@ -24,39 +32,33 @@ class BooksApiTestCase(APITestCase):
     def test_get(self):
         url = reverse('book-list')
         response = self.client.get(url)
-        books = Book.objects.all().annotate(
-            annotated_like=Count(Case(When(
-                userbookrelation__like=True, then=1)))
-        ).order_by('id')
+        books = Book.objects.all().order_by('id')
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
         self.assertEqual(serializer_data[0]['rating'], '5.00')
         self.assertEqual(serializer_data[0]['annotated_like'], 1)
 
     def test_get_search(self):
         url = reverse('book-list')
-        books = Book.objects.filter(id__in=[self.book_1.id, self.book_3.id]).annotate(
-            annotated_like=Count(Case(When(
-                userbookrelation__like=True, then=1)))
-        ).order_by('id')
+        books = Book.objects.filter(id__in=[self.book_1.id, self.book_3.id]).order_by('id')
         response = self.client.get(url, data={'search': 'Author 1'})
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_ordering_asc(self):
         url = reverse('book-list') + '?ordering=price'
         response = self.client.get(url)
         # print(response.data)
-        prices = [item['price'] for item in response.data]
+        prices = [item['price'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(prices, ['10.00', '20.00', '30.00'])
 
     def test_get_ordering_desc(self):
         url = reverse('book-list') + '?ordering=-price'
         response = self.client.get(url)
-        prices = [item['price'] for item in response.data]
+        prices = [item['price'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(prices, ['30.00', '20.00', '10.00'])
 
@@ -64,7 +66,7 @@ class BooksApiTestCase(APITestCase):
         url = reverse('book-list') + '?ordering=author'
         response = self.client.get(url)
         # print(response.data)
-        authors = [item['author'] for item in response.data]
+        authors = [item['author'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(authors, ['Author 1', 'Author 2', 'Author 3'])
 
@@ -83,6 +85,15 @@ class BooksApiTestCase(APITestCase):
         self.assertEqual(Book.objects.all().count(), 4)
         self.assertEqual(self.user, Book.objects.last().owner)
 
+    def test_create_duplicate(self):
+        url = reverse('book-list')
+        data = {'name': self.book_1.name, 'price': '20.00', 'author': self.book_1.author}
+        self.client.force_login(self.user)
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(['unique'], [error.code for error in response.data['non_field_errors']])
+        self.assertEqual(Book.objects.all().count(), 3)
+
     def test_update(self):
         url = reverse('book-detail', args=(self.book_1.id,))
         data = {
@@ -140,6 +151,195 @@ class BooksApiTestCase(APITestCase):
         self.assertEqual(response_get.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class BooksPaginationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.books = Book.objects.bulk_create(
+            Book(name=f'Test book {i}', price=10 + i % 3, author=f'Author {i % 2}') for i in range(7)
+        )
+
+    def collect(self, url, data):
+        ids = []
+        response = self.client.get(url, data=data)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_pages(self):
+        url = reverse('book-list')
+        for ordering in ('price', '-price', 'author', '-author'):
+            # Ties are broken by id in the direction of the ordering.
+            tiebreaker = '-id' if ordering.startswith('-') else 'id'
+            expected = list(Book.objects.order_by(ordering, tiebreaker).values_list('id', flat=True))
+            ids, last_response = self.collect(url, {'page_size': 3, 'ordering': ordering})
+            self.assertEqual(expected, ids, ordering)
+
+            previous_ids = [item['id'] for item in last_response.data['results']]
+            response = last_response
+            while response.data['previous']:
+                response = self.client.get(response.data['previous'])
+                previous_ids = [item['id'] for item in response.data['results']] + previous_ids
+            self.assertEqual(expected, previous_ids, ordering)
+
+    def test_with_filters(self):
+        url = reverse('book-list')
+        expected = list(Book.objects.filter(price=11, author__icontains='Author 1').order_by('id')
+                        .values_list('id', flat=True))
+        ids, _ = self.collect(url, {'page_size': 1, 'price': 11, 'search': 'Author 1'})
+        self.assertEqual(expected, ids)
+
+    def test_page_size_cap(self):
+        url = reverse('book-list')
+        with override_settings(STORE_BOOK_MAX_PAGE_SIZE=2):
+            response = self.client.get(url, data={'page_size': 100})
+        self.assertEqual(2, len(response.data['results']))
+
+    def test_page_size_setting(self):
+        with override_settings(STORE_BOOK_PAGE_SIZE=1):
+            response = self.client.get(reverse('book-list'))
+        self.assertEqual(1, len(response.data['results']))
+
+    def test_invalid_cursor(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'cursor': 'cD1bIngiXQ=='})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_constant_query(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 3, 'ordering': 'price'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        sql = next(query['sql'] for query in queries.captured_queries if 'LIMIT' in query['sql'])
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('LIMIT 4', sql)
+
+
+class BookReadersTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = User.objects.bulk_create(
+            User(username=f'user{i}', first_name=f'Name {i}', last_name='Petrov') for i in range(8)
+        )
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2')
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.book_1)
+        UserBookRelation.objects.create(user=self.users[0], book=self.book_2)
+
+    def test_list_preview(self):
+        response = self.client.get(reverse('book-list'))
+        book_1, book_2 = response.data['results']
+        self.assertEqual(8, book_1['readers_count'])
+        self.assertEqual(['Name 0', 'Name 1', 'Name 2', 'Name 3', 'Name 4'],
+                         [reader['first_name'] for reader in book_1['readers']])
+        self.assertEqual(1, book_2['readers_count'])
+        self.assertEqual(['Name 0'], [reader['first_name'] for reader in book_2['readers']])
+
+    def test_list_queries(self):
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        User.objects.bulk_create(User(username=f'more{i}') for i in range(20))
+        for user in User.objects.filter(username__startswith='more'):
+            UserBookRelation.objects.create(user=user, book=self.book_2)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(5, len(response.data['results'][1]['readers']))
+
+    def test_readers(self):
+        url = reverse('book-readers', args=(self.book_1.id,))
+        response = self.client.get(url, data={'page_size': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [reader['first_name'] for reader in response.data['results']]
+        response = self.client.get(response.data['next'])
+        names += [reader['first_name'] for reader in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([f'Name {i}' for i in range(8)], names)
+
+    def test_readers_ordering(self):
+        url = reverse('book-readers', args=(self.book_1.id,))
+        for ordering in ('price', '-author'):
+            response = self.client.get(url, data={'ordering': ordering, 'page_size': 3})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(['Name 0', 'Name 1', 'Name 2'],
+                             [reader['first_name'] for reader in response.data['results']])
+
+    def test_readers_not_found(self):
+        response = self.client.get(reverse('book-readers', args=(self.book_2.id + 100,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BooksConditionalTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='admin', password='9900')
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2', owner=self.user)
+
+    def test_detail_not_modified(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(etag, response['ETag'])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_list_not_modified(self):
+        url = reverse('book-list')
+        etag = self.client.get(url, data={'ordering': 'price'})['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, data={'ordering': '-price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.book_2.delete()
+        response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_match(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+
+        response = self.client.patch(url, data=json.dumps({'price': '15.00'}), content_type='application/json',
+                                     HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_etag = response['ETag']
+        self.assertNotEqual(etag, new_etag)
+
+        response = self.client.patch(url, data=json.dumps({'price': '16.00'}), content_type='application/json',
+                                     HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.book_1.refresh_from_db()
+        self.assertEqual(15, self.book_1.price)
+
+        self.assertEqual(new_etag, self.client.get(url)['ETag'])
+        response = self.client.delete(url, HTTP_IF_MATCH=new_etag)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_not_found(self):
+        response = self.client.get(reverse('book-detail', args=('abc',)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class BooksRelationTestCase(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='admin', password='9900')
@@ -180,3 +380,167 @@ class BooksRelationTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
         self.assertEqual(3, relation.rate)
+        self.book_1.refresh_from_db()
+        self.assertEqual('3.00', str(self.book_1.rating))
+
+    def test_counters(self):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        self.client.patch(url, data={'like': True, 'rate': 4}, format='json')
+        self.client.patch(url, data={'like': True, 'rate': 2}, format='json')
+        self.client.force_login(self.user2)
+        self.client.patch(url, data={'in_bookmark': True, 'rate': 5}, format='json')
+
+        self.assertEqual(2, UserBookRelation.objects.filter(book=self.book_1).count())
+        self.book_1.refresh_from_db()
+        self.assertEqual((1, 1, 2, 7, '3.50'), (
+            self.book_1.likes_count, self.book_1.bookmarks_count, self.book_1.ratings_count,
+            self.book_1.ratings_sum, str(self.book_1.rating)))
+
+    def test_upsert_queries(self):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_authenticate(self.user)
+        # savepoint, relation, insert, book counters, release; then
+        # savepoint, relation, update, book counters, release. The book row is
+        # never locked.
+        for rate, queries in ((3, 5), (4, 5)):
+            with self.assertNumQueries(queries):
+                response = self.client.patch(url, data={'rate': rate}, format='json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(rate, response.data['rate'])
+
+    def test_conflict(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=4)
+        self.assertEqual({}, logic.insert_relations([UserBookRelation(user=self.user, book=self.book_1, rate=1)]))
+
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_authenticate(self.user)
+        stored = logic.locked_relations(self.user, [self.book_1.pk])
+        # The first read misses the row, as if another transaction committed
+        # it right after: the INSERT runs into the conflict and skips it.
+        with mock.patch.object(logic, 'locked_relations', side_effect=[{}, stored]):
+            response = self.client.patch(url, data={'rate': 2}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((True, 2), (response.data['like'], response.data['rate']))
+        self.assertEqual(1, UserBookRelation.objects.filter(book=self.book_1).count())
+        self.book_1.refresh_from_db()
+        self.assertEqual((1, 0, 1, 2, '2.00'), (
+            self.book_1.likes_count, self.book_1.bookmarks_count, self.book_1.ratings_count,
+            self.book_1.ratings_sum, str(self.book_1.rating)))
+
+    def test_missing_book(self):
+        self.client.force_authenticate(self.user)
+        for book_id in (self.book_2.id + 1, 'unknown'):
+            url = reverse('userbookrelation-detail', args=(book_id,))
+            response = self.client.patch(url, data={'like': True}, format='json')
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+
+class BooksRelationBulkTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='admin', password='9900')
+        self.user2 = User.objects.create_user(username='admin2', password='9900')
+        self.books = Book.objects.bulk_create(
+            Book(name=f'Test book {i}', price=10 + i, author=f'Author {i}') for i in range(30)
+        )
+        self.url = reverse('userbookrelation-bulk')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk(self):
+        book_1, book_2, book_3 = self.books[:3]
+        UserBookRelation.objects.create(user=self.user, book=book_1, like=True, rate=2)
+        UserBookRelation.objects.create(user=self.user2, book=book_1, rate=4)
+        data = [
+            {'book': book_1.id, 'rate': 5},
+            {'book': book_2.id, 'like': True, 'in_bookmark': True, 'rate': 3},
+            {'book': book_3.id},
+        ]
+        response = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        expected_data = [
+            {'book': book_1.id, 'like': True, 'in_bookmark': False, 'rate': 5},
+            {'book': book_2.id, 'like': True, 'in_bookmark': True, 'rate': 3},
+            {'book': book_3.id, 'like': False, 'in_bookmark': False, 'rate': 1},
+        ]
+        self.assertEqual(expected_data, response.data)
+        self.assertEqual(4, UserBookRelation.objects.count())
+
+        counters = Book.objects.filter(pk__in=(book_1.pk, book_2.pk, book_3.pk)).order_by('pk').values_list(
+            'likes_count', 'bookmarks_count', 'ratings_count', 'ratings_sum', 'rating')
+        self.assertEqual([(1, 0, 2, 9, Decimal('4.50')), (1, 1, 1, 3, Decimal('3.00')), (0, 0, 1, 1, Decimal('1.00'))],
+                         list(counters))
+
+    def test_unchanged(self):
+        UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=2)
+        version = Book.objects.get(pk=self.books[0].pk).version
+        response = self.client.post(self.url, data=[{'book': self.books[0].id, 'like': True}], format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(version, Book.objects.get(pk=self.books[0].pk).version)
+
+    def test_queries(self):
+        # savepoint, books, relations, insert, counters, release, whatever
+        # the number of items.
+        for books in (self.books[:2], self.books[2:]):
+            data = [{'book': book.id, 'like': True, 'rate': 5} for book in books]
+            with self.assertNumQueries(6):
+                response = self.client.post(self.url, data=data, format='json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_invalid(self):
+        book_id = self.books[0].id
+        for data in ([], {'book': book_id}, [{'book': book_id}, {'book': book_id}], [{'book': 'unknown'}],
+                     [{'book': self.books[-1].id + 1}], [{'book': book_id, 'rate': 6}]):
+            response = self.client.post(self.url, data=data, format='json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, data)
+        with override_settings(STORE_RELATION_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, data=[{'book': book.id} for book in self.books[:3]], format='json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_batches(self):
+        # savepoint, books, relations and insert per batch of 10, counters
+        # per batch of books with equal deltas (two deltas of 15 books),
+        # release. The latency of a full request is in
+        # benchmarks/relation_bulk.py.
+        data = [{'book': book.id, 'like': i % 2 == 0, 'rate': 5} for i, book in enumerate(self.books)]
+        with override_settings(STORE_RELATION_BULK_BATCH_SIZE=10), self.assertNumQueries(1 + 1 + 3 * 2 + 2 * 2 + 1):
+            response = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(30, len(response.data))
+        self.assertEqual(15, Book.objects.filter(likes_count=1, ratings_count=1, ratings_sum=5).count())
+        self.assertEqual(30, UserBookRelation.objects.filter(user=self.user).count())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class BooksRelationConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_first_writes(self):
+        users = [User.objects.create(username=f'user{i}') for i in range(4)]
+        book = Book.objects.create(name='Test book 1', price=10, author='Author 1')
+        url = reverse('userbookrelation-detail', args=(book.id,))
+        start = threading.Barrier(len(users) * 2)
+        errors = []
+
+        def click(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            start.wait()
+            try:
+                response = client.patch(url, data={'like': True, 'rate': 4}, format='json')
+                if response.status_code != status.HTTP_200_OK:
+                    errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        # Every user clicks twice at the same time.
+        threads = [threading.Thread(target=click, args=(user,)) for user in users for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(len(users), UserBookRelation.objects.filter(book=book).count())
+        book.refresh_from_db()
+        self.assertEqual((4, 4, 16, '4.00'), (book.likes_count, book.ratings_count, book.ratings_sum, str(book.rating)))
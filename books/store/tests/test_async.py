@@ -0,0 +1,116 @@
+import base64
+import json
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from rest_framework import status
+
+from books.urls import async_book_urls, urlpatterns as book_urls
+from store.models import Book, UserBookRelation
+
+urlpatterns = async_book_urls + book_urls
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class BookReadViewTestCase(TestCase):
+    """BookReadView answers like the BookViewSet routes it replaces."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='9900')
+        readers = [User.objects.create(username=f'reader{i}', first_name=f'Name {i}') for i in range(7)]
+        for i in range(12):
+            book = Book.objects.create(name=f'Test book {i}', price=10 + i % 4, author=f'Author {i % 3}',
+                                       owner=cls.user if i % 2 else None)
+            for reader in readers[:i % 8]:
+                UserBookRelation.objects.create(user=reader, book=book, like=True, rate=1 + i % 5)
+        cls.book = Book.objects.order_by('id').last()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_async(self):
+        self.assertTrue(iscoroutinefunction(resolve(reverse('book-list')).func))
+        self.assertTrue(iscoroutinefunction(resolve(reverse('book-detail', args=(self.book.id,))).func))
+        # List actions are left to the router.
+        for name in ('facets', 'export'):
+            self.assertEqual(name, resolve(reverse(f'book-{name}')).func.actions['get'])
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    async def assertSameResponse(self, url, data=None, **headers):
+        with override_settings(ROOT_URLCONF='books.urls'):
+            expected = await sync_to_async(self.client.get)(url, data, headers=headers)
+        response = await self.async_client.get(url, data, headers=headers)
+        self.assertEqual(expected.status_code, response.status_code)
+        self.assertEqual(expected.content, response.content)
+        for header in ('ETag', 'Last-Modified'):
+            self.assertEqual(expected.get(header), response.get(header))
+        return response
+
+    async def test_list(self):
+        url = reverse('book-list')
+        response = await self.assertSameResponse(url, {'page_size': 5})
+        await self.assertSameResponse(response.json()['next'])
+        for params in ({'ordering': '-price'}, {'search': 'book 1'}, {'price': 11}, {'cursor': 'invalid'}):
+            with self.subTest(params):
+                await self.assertSameResponse(url, params)
+        with override_settings(STORE_BOOK_FAST_LIST=False):
+            await self.assertSameResponse(url, {'ordering': 'author'})
+
+    async def test_detail(self):
+        await self.assertSameResponse(reverse('book-detail', args=(self.book.id,)))
+        await self.assertSameResponse(reverse('book-detail', args=(self.book.id + 1,)))
+        await self.assertSameResponse(reverse('book-detail', args=('invalid',)))
+
+    # The sync test client runs the async views in an event loop of its
+    # own, their queries still go through the connection of the test.
+
+    def test_cache(self):
+        url = reverse('book-detail', args=(self.book.id,))
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+        with self.assertNumQueries(1):  # the ETag of the book
+            response = self.client.get(url)
+        self.assertEqual('HIT', response['X-Cache'])
+
+        response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_queries(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('book-list'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('book-detail', args=(self.book.id,)))
+
+    async def test_no_thread(self):
+        # Neither anonymous nor session reads run the view in a thread.
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('store.views.sync_to_async', side_effect=AssertionError):
+            response = await self.async_client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    async def test_basic_authentication(self):
+        credentials = base64.b64encode(b'owner:9900').decode()
+        response = await self.async_client.get(reverse('book-list'), headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        credentials = base64.b64encode(b'owner:wrong').decode()
+        response = await self.async_client.get(reverse('book-list'), headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    async def test_write(self):
+        await self.async_client.aforce_login(self.user)
+        data = {'name': 'New book', 'price': '12.00', 'author': 'Author 9'}
+        response = await self.async_client.post(reverse('book-list'), json.dumps(data),
+                                                content_type='application/json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+        url = reverse('book-detail', args=(response.json()['id'],))
+        data['price'] = '13.00'
+        response = await self.async_client.put(url, json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('13.00', (await self.async_client.get(url)).json()['price'])
@@ -0,0 +1,126 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import cache_stats, invalidate_all
+from store.checks import check_shared_cache
+from store.models import Book, UserBookRelation
+
+
+class BookCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='admin', password='9900')
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2', owner=self.user)
+
+    def get(self, url, **data):
+        response = self.client.get(url, data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_detail(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.assertEqual('MISS', self.get(url)['X-Cache'])
+        with self.assertNumQueries(1):  # the ETag of the book
+            response = self.get(url)
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual('Test book 1', response.data['name'])
+
+        self.assertEqual('MISS', self.get(reverse('book-detail', args=(self.book_2.id,)))['X-Cache'])
+        self.assertEqual({'book': {'hits': 1, 'misses': 2, 'hit_rate': 0.333},
+                          'list': {'hits': 0, 'misses': 0, 'hit_rate': None},
+                          'facets': {'hits': 0, 'misses': 0, 'hit_rate': None}}, cache_stats())
+
+    def test_list_signature(self):
+        url = reverse('book-list')
+        self.assertEqual('MISS', self.get(url, ordering='price', search='book')['X-Cache'])
+        self.assertEqual('HIT', self.get(url, search='book', ordering='price')['X-Cache'])
+        self.assertEqual('MISS', self.get(url, ordering='-price', search='book')['X-Cache'])
+        self.assertEqual('MISS', self.get(url, ordering='price', search='book', page_size=1)['X-Cache'])
+
+    def test_book_write_invalidates(self):
+        detail_url = reverse('book-detail', args=(self.book_1.id,))
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        list_url = reverse('book-list')
+        for url in (detail_url, other_url, list_url):
+            self.get(url)
+
+        self.client.force_login(self.user)
+        data = {'name': 'Renamed', 'price': '10.00', 'author': 'Author 1'}
+        response = self.client.put(detail_url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.get(detail_url)
+        self.assertEqual(('MISS', 'Renamed'), (response['X-Cache'], response.data['name']))
+        self.assertEqual('HIT', self.get(other_url)['X-Cache'])
+        response = self.get(list_url)
+        self.assertEqual(('MISS', 'Renamed'), (response['X-Cache'], response.data['results'][0]['name']))
+
+        self.book_2.delete()
+        self.assertEqual(1, len(self.get(list_url).data['results']))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(other_url).status_code)
+
+    def test_relation_write_invalidates(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.get(url)
+        relation = UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+        self.assertEqual(1, self.get(url).data['annotated_like'])
+
+        relation.delete()
+        self.assertEqual(0, self.get(url).data['annotated_like'])
+
+    def test_user_write_invalidates(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        reader = User.objects.create_user(username='reader', password='9900')
+        UserBookRelation.objects.create(user=reader, book=self.book_2, rate=4)
+        etag = self.get(url)['ETag']
+        self.get(other_url)
+
+        self.user.username = 'renamed'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(('MISS', 'renamed'), (response['X-Cache'], response.data['owner_name']))
+        self.assertNotEqual(etag, response['ETag'])
+
+        reader.first_name = 'Ann'
+        reader.save()
+        response = self.get(other_url)
+        self.assertEqual(('MISS', [{'first_name': 'Ann', 'last_name': ''}]),
+                         (response['X-Cache'], response.data['readers']))
+
+        # A login changes no rendered field.
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual('HIT', self.get(url)['X-Cache'])
+
+    def test_invalidate_all(self):
+        url = reverse('book-list')
+        self.get(url)
+        Book.objects.update(price=99)
+        invalidate_all()
+        self.assertEqual('99.00', self.get(url).data['results'][0]['price'])
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        url = reverse('book-list')
+        self.get(url)
+        self.assertEqual('MISS', self.get(url)['X-Cache'])
+
+
+class SharedCacheCheckTestCase(SimpleTestCase):
+    def test_process_cache(self):
+        self.assertEqual(['store.E001'], [error.id for error in check_shared_cache(None)])
+        with override_settings(STORE_CACHE_TIMEOUT=0, DATABASE_REPLICAS=[]):
+            self.assertEqual([], check_shared_cache(None))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://cache:6379/0'}})
+    def test_shared_cache(self):
+        self.assertEqual([], check_shared_cache(None))
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from store.counter_buffer import CounterBuffer
+from store.models import Book, UserBookRelation
+
+
+@override_settings(STORE_COUNTER_MODE='buffered')
+class CounterBufferTestCase(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1')
+        self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2')
+
+        self.buffer = CounterBuffer(flush_size=10, flush_interval=3600, max_staleness=3600)
+        self.buffer.start()
+        patcher = mock.patch('store.counter_buffer.get_counter_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.buffer.stop)
+
+    def relate(self, user, book, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return UserBookRelation.objects.create(user=user, book=book, **kwargs)
+
+    def test_coalesce(self):
+        self.relate(self.user1, self.book_1, like=True, rate=5)
+        relation = self.relate(self.user2, self.book_1, like=True, rate=3)
+        self.relate(self.user1, self.book_2, in_bookmark=True, rate=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            relation.delete()
+
+        self.book_1.refresh_from_db()
+        self.assertEqual(0, self.book_1.likes_count)
+
+        with self.assertNumQueries(4):  # savepoint, one UPDATE per book, release
+            self.assertEqual(2, self.buffer.flush())
+
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEqual((1, 1, '5.00'), (self.book_1.likes_count, self.book_1.ratings_count, str(self.book_1.rating)))
+        self.assertEqual((1, 1, '4.00'), (self.book_2.bookmarks_count, self.book_2.ratings_count, str(self.book_2.rating)))
+
+    def test_rolled_back_change_is_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True)
+        self.assertTrue(callbacks)
+        self.assertEqual(0, self.buffer.flush())
+
+    def test_synchronous_fallback(self):
+        self.buffer.stop()
+        self.relate(self.user1, self.book_1, like=True, rate=5)
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+
+    def test_staleness_bound(self):
+        self.buffer.max_staleness = -1
+        self.relate(self.user1, self.book_1, like=True, rate=5)
+        self.relate(self.user2, self.book_1, like=True, rate=3)
+        self.book_1.refresh_from_db()
+        self.assertEqual(2, self.book_1.likes_count)
@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+from books.database import database_settings
+
+
+class DatabaseSettingsTestCase(TestCase):
+    def test_pool(self):
+        database = database_settings({'DB_HOST': 'db', 'DB_POOL_MAX_SIZE': '20', 'DB_POOL_TIMEOUT': '2.5'})
+        self.assertEqual('django.db.backends.postgresql', database['ENGINE'])
+        self.assertEqual('db', database['HOST'])
+        # Django passes check= to the pool itself when health checks are on,
+        # so the pool options must not.
+        self.assertEqual({'min_size': 2, 'max_size': 20, 'timeout': 2.5}, database['OPTIONS']['pool'])
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        # Django refuses persistent connections together with a pool.
+        self.assertNotIn('CONN_MAX_AGE', database)
+
+    def test_persistent(self):
+        database = database_settings({'DB_POOL': 'false'})
+        self.assertNotIn('OPTIONS', database)
+        self.assertEqual(60, database['CONN_MAX_AGE'])
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertIsNone(database_settings({'DB_POOL': '0', 'DB_CONN_MAX_AGE': 'none'})['CONN_MAX_AGE'])
+        self.assertEqual(0, database_settings({'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'})['CONN_MAX_AGE'])
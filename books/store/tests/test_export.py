@@ -0,0 +1,72 @@
+import json
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.test import tag
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+from store.serializers import BookSerializer
+
+
+class BooksExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', first_name='Ivan', last_name='Petrov')
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+
+    def expected(self, books):
+        return json.loads(json.dumps(BookSerializer(books.order_by('id'), many=True).data))
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('book-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(self.expected(Book.objects.all()), [json.loads(line) for line in lines])
+
+    def test_json_with_filters(self):
+        response = self.client.get(reverse('book-export'), data={'output': 'json', 'search': 'Author 2'})
+        self.assertEqual('application/json', response['Content-Type'])
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(self.expected(Book.objects.filter(id=self.book_2.id)), data)
+
+    def test_empty(self):
+        Book.objects.all().delete()
+        response = self.client.get(reverse('book-export'), data={'output': 'json'})
+        self.assertEqual([], json.loads(b''.join(response.streaming_content)))
+
+    def export_peak(self, start, stop):
+        """Create books start to stop, then export all the books and return
+        the number of lines, their size and the peak of traced memory."""
+        Book.objects.bulk_create(
+            (Book(name=f'Book {i}', price=i % 1000, author=f'Author {i % 500}') for i in range(start, stop)),
+            batch_size=5000,
+        )
+        response = self.client.get(reverse('book-export'))
+
+        tracemalloc.start()
+        try:
+            lines = size = 0
+            for chunk in response.streaming_content:
+                lines += 1
+                size += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return lines, size, peak
+
+    @tag('slow')
+    def test_bounded_memory(self):
+        lines, _, small_peak = self.export_peak(0, 20_000)
+        self.assertEqual(20_002, lines)
+        lines, size, peak = self.export_peak(20_000, 100_000)
+        self.assertEqual(100_002, lines)
+        self.assertGreater(size, 10 * 1024 * 1024)
+        # A few chunks of books and their rows, never the whole catalogue
+        # (BookSerializer(...).data of all of them takes hundreds of MB): five
+        # times the books take about the same memory.
+        self.assertLess(peak, small_peak * 1.5)
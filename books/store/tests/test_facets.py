@@ -0,0 +1,82 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class BookFacetsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='admin', password='9900')
+        for i, (price, author) in enumerate([(5, 'Tolkien'), (9.99, 'Tolkien'), (10, 'Pratchett'),
+                                             (25, 'Tolkien'), (25, 'Pratchett'), (48, 'Austen')]):
+            Book.objects.create(name=f'Book {i}', price=price, author=author, owner=self.user)
+
+    def facets(self, **params):
+        response = self.client.get(reverse('book-facets'), params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        return response
+
+    def test_facets(self):
+        self.assertEqual({
+            'count': 6,
+            'price': [
+                {'from': '0.00', 'to': '10.00', 'count': 2},
+                {'from': '10.00', 'to': '20.00', 'count': 1},
+                {'from': '20.00', 'to': '30.00', 'count': 2},
+                {'from': '40.00', 'to': '50.00', 'count': 1},
+            ],
+            'authors': [
+                {'author': 'Tolkien', 'count': 3},
+                {'author': 'Pratchett', 'count': 2},
+                {'author': 'Austen', 'count': 1},
+            ],
+        }, self.facets().data)
+
+    def test_options(self):
+        data = self.facets(price_bucket='25', authors=1).data
+        self.assertEqual([('0.00', 3), ('25.00', 3)], [(bucket['from'], bucket['count']) for bucket in data['price']])
+        self.assertEqual([{'author': 'Tolkien', 'count': 3}], data['authors'])
+        response = self.client.get(reverse('book-facets'), {'price_bucket': 0})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_filters(self):
+        self.assertEqual({'count': 2, 'price': [{'from': '20.00', 'to': '30.00', 'count': 2}],
+                          'authors': [{'author': 'Pratchett', 'count': 1}, {'author': 'Tolkien', 'count': 1}]},
+                         self.facets(price=25).data)
+        data = self.facets(search='Tolkien').data
+        self.assertEqual(3, data['count'])
+        self.assertEqual([{'author': 'Tolkien', 'count': 3}], data['authors'])
+
+    def test_cache(self):
+        # Both facets in one statement.
+        with self.assertNumQueries(1):
+            self.assertEqual('MISS', self.facets(search='tolkien', ordering='price')['X-Cache'])
+        with self.assertNumQueries(0):
+            # Ordering and pagination do not change the facets.
+            response = self.facets(ordering='-price', page_size=3, search='tolkien')
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual('MISS', self.facets(search='austen')['X-Cache'])
+        self.assertEqual('MISS', self.facets(search='tolkien', authors=2)['X-Cache'])
+        self.assertEqual('HIT', self.facets(search='tolkien', price_bucket='10.00')['X-Cache'])
+
+    def test_book_write_invalidates(self):
+        self.facets()
+        # Relations change counters only, which are not faceted.
+        UserBookRelation.objects.create(user=self.user, book=Book.objects.first(), like=True)
+        self.assertEqual('HIT', self.facets()['X-Cache'])
+
+        self.client.force_login(self.user)
+        book = Book.objects.get(name='Book 5')
+        response = self.client.patch(reverse('book-detail', args=(book.id,)), json.dumps({'author': 'Tolkien'}),
+                                     content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.facets()
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual([{'author': 'Tolkien', 'count': 4}, {'author': 'Pratchett', 'count': 2}],
+                         response.data['authors'])
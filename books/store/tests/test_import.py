@@ -0,0 +1,115 @@
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+
+
+class BookImportApiTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.user = User.objects.create(username='user')
+        self.book = Book.objects.create(name='Test book 1', price=10, author='Author 1', owner=self.user)
+        self.url = reverse('book-import-books')
+        self.client.force_authenticate(self.admin)
+
+    def books(self):
+        return list(Book.objects.order_by('name').values_list('name', 'author', 'price', 'owner__username'))
+
+    def test_json(self):
+        data = [
+            {'name': 'Test book 1', 'author': 'Author 1', 'price': '12.50'},
+            {'name': 'Test book 2', 'author': 'Author 2', 'price': '20.00'},
+            {'name': 'Test book 3', 'price': 'free'},
+            {'author': 'Author 4', 'price': '5.00'},
+        ]
+        version = self.book.version
+        response = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'created': 1, 'updated': 1, 'unchanged': 0, 'invalid': 2},
+                         {key: value for key, value in response.data.items() if key != 'errors'})
+        self.assertEqual([3, 4], [error['row'] for error in response.data['errors']])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertIn('name', response.data['errors'][1]['errors'])
+
+        self.assertEqual([('Test book 1', 'Author 1', Decimal('12.50'), 'user'),
+                          ('Test book 2', 'Author 2', Decimal('20.00'), 'admin')], self.books())
+        self.book.refresh_from_db()
+        self.assertEqual(version + 1, self.book.version)
+
+        response = self.client.post(self.url, data=data[:2], format='json')
+        self.assertEqual({'created': 0, 'updated': 0, 'unchanged': 2, 'invalid': 0, 'errors': []}, response.data)
+
+    def test_csv(self):
+        content = 'name,price,author\nTest book 2,20,"Author, 2"\nTest book 2,21,"Author, 2"\nTest book 3,x,\n'
+        response = self.client.generic('POST', self.url, content, content_type='text/csv; charset=utf-8')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((1, 1), (response.data['created'], response.data['invalid']))
+        self.assertEqual(('Test book 2', 'Author, 2', Decimal('21.00'), 'admin'), self.books()[1])
+
+    def test_ndjson(self):
+        content = '{"name": "Test book 2", "price": 20}\n\n{"name": \n'
+        response = self.client.generic('POST', self.url, content, content_type='application/x-ndjson')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((1, 1), (response.data['created'], response.data['invalid']))
+        self.assertEqual(3, response.data['errors'][0]['row'])
+        self.assertEqual(('Test book 2', '', Decimal('20.00'), 'admin'), self.books()[1])
+
+    def test_invalid_body(self):
+        response = self.client.post(self.url, data={'name': 'Test book 2', 'price': 20}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_not_staff(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(self.url, data=[{'name': 'Test book 2', 'price': 20}], format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(1, Book.objects.count())
+
+    def test_chunks(self):
+        data = [{'name': f'Book {i}', 'author': 'Author', 'price': i} for i in range(1, 12)]
+        with self.settings(STORE_IMPORT_CHUNK_SIZE=5), mock.patch('store.importer.invalidate_all') as invalidate:
+            # savepoint, lookup, insert and release per chunk
+            with self.assertNumQueries(3 * 4):
+                response = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(11, response.data['created'])
+        # Each chunk invalidates the cache as it commits.
+        self.assertEqual(3, invalidate.call_count)
+
+
+class ImportBooksCommandTestCase(TestCase):
+    def import_file(self, suffix, content, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', file.name, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv(self):
+        User.objects.create(username='publisher')
+        out, err = self.import_file('.csv', 'name,price,author\nBook 1,10,Author\nBook 2,,Author\n',
+                                    '--owner', 'publisher')
+        self.assertIn('Created 1, updated 0, unchanged 0 books; 1 invalid rows', out)
+        self.assertIn('Row 2: price:', err)
+        self.assertEqual(['publisher'], list(Book.objects.values_list('owner__username', flat=True)))
+
+    def test_ndjson(self):
+        Book.objects.create(name='Book 1', price=10, author='Author')
+        out, err = self.import_file('.txt', '{"name": "Book 1", "price": 15, "author": "Author"}\n',
+                                    '--format', 'ndjson')
+        self.assertIn('Created 0, updated 1', out)
+        self.assertEqual(Decimal('15.00'), Book.objects.get().price)
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.import_file('.txt', '')
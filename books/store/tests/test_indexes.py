@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+
+
+class QueryPlanTestCase(APITestCase):
+    """The main queries of the API are answered from the indexes declared on
+    the models rather than by scanning and sorting the tables."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        Book.objects.bulk_create(Book(name=f'Book {i}', price=i % 50, author=f'Author {i % 30}')
+                                 for i in range(300))
+        self.book = Book.objects.first()
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, in_bookmark=True)
+        if connection.vendor == 'postgresql':
+            # With so few rows the planner would rightly prefer a sequential scan.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql)
+            return '\n'.join(str(row) for row in cursor.fetchall())
+
+    def list_query(self, **params):
+        """Plan of the page query behind GET /book/ with params, including the
+        keyset condition of a second page."""
+        response = self.client.get(reverse('book-list'), data={'page_size': 10, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        page = [query['sql'] for query in queries
+                if 'ORDER BY' in query['sql'] and 'FROM "store_book"' in query['sql']]
+        self.assertEqual(1, len(page))
+        return self.plan(page[0])
+
+    def test_ordering_price(self):
+        plan = self.list_query(ordering='price')
+        self.assertIn('store_book_price_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_ordering_author(self):
+        plan = self.list_query(ordering='-author')
+        self.assertIn('store_book_author_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_relation_lookup(self):
+        query = UserBookRelation.objects.filter(user=self.user, book=self.book)
+        plan = self.plan(str(query.query))
+        self.assertRegex(plan, r'store_userbookrelation_user_book|sqlite_autoindex_store_userbookrelation')
+
+    def test_counted_relations(self):
+        for condition, index in (({'like': True}, 'store_ubr_book_liked'),
+                                 ({'in_bookmark': True}, 'store_ubr_book_bookmarked')):
+            query = UserBookRelation.objects.filter(book=self.book, **condition).values('pk')
+            self.assertIn(index, self.plan(str(query.query)))
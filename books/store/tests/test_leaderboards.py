@@ -0,0 +1,115 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.leaderboards import OVERLAP, refresh_leaderboards
+from store.models import Book, LeaderboardEntry, UserBookRelation
+
+
+@override_settings(STORE_LEADERBOARD_SIZE=3, STORE_LEADERBOARD_MIN_VOTES=2)
+class LeaderboardTestCase(APITestCase):
+    def setUp(self):
+        self.readers = [User.objects.create(username=f'reader {i}') for i in range(4)]
+        self.book_1 = Book.objects.create(name='Book 1', price=10, author='Author 1')
+        self.book_2 = Book.objects.create(name='Book 2', price=20, author='Author 1')
+        self.book_3 = Book.objects.create(name='Book 3', price=30, author='Author 2')
+        self.book_4 = Book.objects.create(name='Book 4', price=40, author='Author 2')
+        self.vote(self.book_1, rate=5, like=True, readers=1)
+        self.vote(self.book_2, rate=4, like=True, readers=3)
+        self.vote(self.book_3, rate=3, in_bookmark=True, readers=2)
+        self.vote(self.book_4, rate=2, like=True, in_bookmark=True, readers=4)
+
+    def vote(self, book, readers, **values):
+        for reader in self.readers[:readers]:
+            UserBookRelation.objects.update_or_create(user=reader, book=book, defaults=values)
+
+    def board(self, board, **params):
+        response = self.client.get(reverse('book-leaderboard', args=(board,)), params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [entry['book']['name'] for entry in response.data['results']]
+
+    def test_boards(self):
+        refresh_leaderboards()
+        # Book 1 has a single rating, below STORE_LEADERBOARD_MIN_VOTES.
+        self.assertEqual(['Book 2', 'Book 3', 'Book 4'], self.board('rating'))
+        self.assertEqual(['Book 4', 'Book 2', 'Book 1'], self.board('likes'))
+        self.assertEqual(['Book 4', 'Book 3'], self.board('bookmarks'))
+        self.assertEqual(['Book 2', 'Book 1'], self.board('likes', author='Author 1'))
+        self.assertEqual(['Book 4'], self.board('likes', limit=1))
+        self.assertEqual([], self.board('likes', author='Nobody'))
+
+    def test_response(self):
+        refresh_leaderboards()
+        response = self.client.get(reverse('book-leaderboard', args=('rating',)), {'author': 'Author 2'})
+        self.assertEqual('rating', response.data['board'])
+        self.assertEqual('Author 2', response.data['author'])
+        self.assertIsNotNone(response.data['refreshed_at'])
+        self.assertEqual({'position': 1, 'book': {
+            'id': self.book_3.id, 'name': 'Book 3', 'price': '30.00', 'author': 'Author 2', 'annotated_like': 0,
+            'bookmarks_count': 2, 'rating': '3.00', 'readers_count': 2,
+        }}, response.data['results'][0])
+
+    def test_invalid(self):
+        url = reverse('book-leaderboard', args=('rating',))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'limit': 0}).status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get('/book/leaderboard/price/').status_code)
+
+    def test_constant_queries(self):
+        Book.objects.bulk_create(Book(name=f'Other {i}', price=1, author='Author 3', likes_count=i)
+                                 for i in range(200))
+        refresh_leaderboards()
+        self.client.force_authenticate(self.readers[0])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(['Other 199', 'Other 198', 'Other 197'], self.board('likes'))
+        self.assertEqual(1, len(queries))
+
+    def age_books(self):
+        Book.objects.update(updated_at=timezone.now() - OVERLAP * 2)
+
+    def test_incremental(self):
+        self.age_books()
+        refresh_leaderboards()
+        author_1 = list(LeaderboardEntry.objects.filter(author='Author 1').values_list('pk', flat=True))
+        self.vote(self.book_3, readers=4, like=True)
+
+        self.assertEqual(1, refresh_leaderboards()['authors'])
+        self.assertEqual(['Book 3', 'Book 4', 'Book 2'], self.board('likes'))
+        self.assertEqual(['Book 3', 'Book 4'], self.board('likes', author='Author 2'))
+        # The boards of Author 1 were not rebuilt.
+        self.assertEqual(author_1, list(LeaderboardEntry.objects.filter(author='Author 1').values_list('pk', flat=True)))
+
+    def test_author_changed(self):
+        self.age_books()
+        refresh_leaderboards()
+        self.book_2.refresh_from_db()
+        self.book_2.author = 'Author 2'
+        self.book_2.save()
+
+        self.assertEqual(2, refresh_leaderboards()['authors'])
+        self.assertEqual(['Book 1'], self.board('likes', author='Author 1'))
+        self.assertEqual(['Book 4', 'Book 2'], self.board('likes', author='Author 2'))
+
+    def test_deleted_book(self):
+        refresh_leaderboards()
+        self.book_4.delete()
+        self.assertEqual(['Book 2', 'Book 1'], self.board('likes'))
+        refresh_leaderboards(full=True)
+        self.assertFalse(LeaderboardEntry.objects.filter(book_id=self.book_4.pk).exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('refresh_leaderboards', stdout=out)
+        self.assertIn('of the catalogue and of 2 authors, 16 entries', out.getvalue())
+        self.age_books()
+        call_command('refresh_leaderboards', stdout=out)
+        self.assertIn('of 0 authors, 8 entries', out.getvalue())
+        call_command('refresh_leaderboards', '--full', stdout=out)
+        self.assertEqual(2, out.getvalue().count('of 2 authors, 16 entries'))
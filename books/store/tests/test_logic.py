@@ -1,7 +1,12 @@
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-from store.logic import set_rating
+from store import logic
+from store.logic import set_rating, upsert_relations
 from store.models import Book, UserBookRelation
 
 
@@ -23,3 +28,150 @@ class SetRatingTestCase(TestCase):
         set_rating(self.book_1)
         self.book_1.refresh_from_db()
         self.assertEqual('4.67', str(self.book_1.rating))
+
+
+class BookCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1')
+
+    def assertCounters(self, likes, bookmarks, ratings, ratings_sum):
+        self.book_1.refresh_from_db()
+        self.assertEqual((likes, bookmarks, ratings, ratings_sum),
+                         (self.book_1.likes_count, self.book_1.bookmarks_count,
+                          self.book_1.ratings_count, self.book_1.ratings_sum))
+
+    def test_create(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, in_bookmark=True, rate=3)
+        self.assertCounters(1, 1, 2, 8)
+
+    def test_update(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        relation.like = False
+        relation.in_bookmark = True
+        relation.rate = 2
+        relation.save()
+        self.assertCounters(0, 1, 1, 2)
+
+        relation.save()
+        self.assertCounters(0, 1, 1, 2)
+
+    def test_stale_instances(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        first, second = UserBookRelation.objects.get(pk=relation.pk), UserBookRelation.objects.get(pk=relation.pk)
+        first.like = False
+        first.save()
+        # second was loaded before the first save, which it must not undo
+        # twice in the counters.
+        second.like = False
+        second.rate = 3
+        second.save()
+        self.assertCounters(0, 0, 1, 3)
+
+    def test_stale_book(self):
+        stale = Book.objects.get(pk=self.book_1.pk)
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        counted = Book.objects.get(pk=self.book_1.pk).version
+        stale.price = 12
+        stale.save()
+        # The counter UPDATE bumped the version after stale was loaded; the
+        # save bumps it again rather than reissuing it.
+        self.assertEqual(counted + 1, stale.version)
+        self.assertEqual(stale.version, Book.objects.get(pk=self.book_1.pk).version)
+        self.assertCounters(1, 0, 1, 5)
+
+    def test_move(self):
+        book_2 = Book.objects.create(name='Test book 2', price=10, author='Author 2')
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        relation.book = book_2
+        relation.save()
+        self.assertCounters(0, 0, 0, 0)
+        book_2.refresh_from_db()
+        self.assertEqual((1, 0, 1, 5), (book_2.likes_count, book_2.bookmarks_count, book_2.ratings_count,
+                                        book_2.ratings_sum))
+
+    def test_concurrent_first_write(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        stored = logic.locked_relations(self.user1, [self.book_1.pk])
+        # The first read misses the row, as if another transaction committed
+        # it right after; the INSERT skips it and the row is updated instead.
+        with mock.patch.object(logic, 'locked_relations', side_effect=[{}, stored]):
+            relations = upsert_relations(self.user1, {self.book_1.pk: {'rate': 3}, self.book_1.pk + 1: {}})
+        self.assertEqual([(relation.pk, True, 3)], [(relation.pk, relation.like, relation.rate) for relation in relations])
+        self.assertEqual(1, UserBookRelation.objects.count())
+        self.assertCounters(1, 0, 1, 3)
+
+    def test_delete(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=3)
+        relation.delete()
+        self.assertCounters(1, 0, 1, 3)
+
+        self.user2.delete()
+        self.assertCounters(0, 0, 0, 0)
+
+    def test_rebuild(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, like=True, in_bookmark=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=3)
+        book_2 = Book.objects.create(name='Test book 2', price=20, author='Author 2')
+        Book.objects.update(likes_count=7, bookmarks_count=7, ratings_count=7, ratings_sum=7)
+
+        call_command('rebuild_book_counters', stdout=StringIO())
+
+        self.assertCounters(2, 1, 2, 8)
+        book_2.refresh_from_db()
+        self.assertEqual((0, 0, 0, 0), (book_2.likes_count, book_2.bookmarks_count,
+                                        book_2.ratings_count, book_2.ratings_sum))
+
+
+class RatingMaintenanceTestCase(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+
+        self.book_1 = Book.objects.create(name='Test book 1', price=10, author='Author 1')
+
+    def rating(self):
+        self.book_1.refresh_from_db()
+        return self.book_1.rating and str(self.book_1.rating)
+
+    def test_update_and_delete(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, rate=4)
+        self.assertEqual('4.50', self.rating())
+
+        relation.rate = 2
+        relation.save()
+        self.assertEqual('3.00', self.rating())
+
+        relation.delete()
+        self.assertEqual('4.00', self.rating())
+
+        UserBookRelation.objects.all().delete()
+        self.assertIsNone(self.rating())
+
+    def test_single_update_per_vote(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book_1, rate=5)
+        relation.rate = 3
+        with self.assertNumQueries(5):  # savepoint, locked relation, relation UPDATE, book UPDATE, release
+            relation.save()
+
+    def test_check_command(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=4)
+        out = StringIO()
+        call_command('check_book_ratings', batch_size=1, stdout=out)
+        self.assertIn('Checked 1 books, 0 inconsistent', out.getvalue())
+
+        Book.objects.update(rating=1, likes_count=0)
+        out = StringIO()
+        call_command('check_book_ratings', fix=True, stdout=out)
+        self.assertIn(f'Book {self.book_1.id}: likes_count stored 0 expected 1, rating stored 1.00', out.getvalue())
+        self.assertEqual('4.50', self.rating())
+        self.assertEqual(1, self.book_1.likes_count)
@@ -0,0 +1,74 @@
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from books.profiling import normalize_sql, reset_stats
+from store.models import Book
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_REQUEST_MS=10 ** 6)
+class ProfilingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.user = User.objects.create(username='test_username', is_staff=True)
+        for i in range(3):
+            Book.objects.create(name=f'Test book {i}', price=10 + i, author=f'Author {i}', owner=self.user)
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('book-list'))
+        match = re.fullmatch(r'db;dur=[\d.]+;desc="(\d+) queries", serializer;dur=([\d.]+), total;dur=[\d.]+',
+                             response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        self.assertEqual(2, int(match[1]))
+        self.assertGreater(float(match[2]), 0)
+
+    def test_log(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1), self.assertLogs('books.profiling', 'INFO') as logs:
+            self.client.get(reverse('book-detail', args=(Book.objects.first().id,)))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual('GET book-detail', entry['endpoint'])
+        self.assertEqual(200, entry['status'])
+        self.assertEqual(3, entry['queries'])
+        self.assertGreater(entry['serializer_ms'], 0)
+        self.assertEqual(3, len(entry['slowest']))
+        self.assertTrue(all('%s' not in query['sql'] for query in entry['slowest']))
+
+    def test_not_sampled(self):
+        with self.assertNoLogs('books.profiling'):
+            self.client.get(reverse('book-list'))
+
+    def test_stats(self):
+        for book in Book.objects.all():
+            self.client.get(reverse('book-detail', args=(book.id,)))
+        self.client.get('/missing/')
+
+        url = reverse('profiling')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+        self.client.force_authenticate(self.user)
+        endpoints = self.client.get(url).data['endpoints']
+        self.assertEqual({'GET book-detail', 'GET <unresolved>', 'GET profiling'}, set(endpoints))
+        detail = endpoints['GET book-detail']
+        self.assertEqual(3, detail['requests'])
+        self.assertEqual(3, sum(detail['duration_ms']['buckets'].values()))
+        self.assertEqual(3, detail['queries']['buckets']['<=5'])
+        self.assertEqual(9, detail['queries']['sum'])
+        self.assertEqual({'hits': 0, 'misses': 3, 'hit_rate': 0.0}, self.client.get(url).data['cache']['book'])
+
+        # A request is recorded once it has been answered.
+        self.client.delete(url)
+        response = self.client.get(url)
+        self.assertEqual(['DELETE profiling'], list(response.data['endpoints']))
+        self.assertEqual(0, response.data['cache']['book']['misses'])
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            'SELECT "id" FROM "store_book" WHERE ("name" = ? AND "id" IN (?, ...)) LIMIT ?',
+            normalize_sql('SELECT "id" FROM "store_book"\n WHERE ("name" = \'it\'\'s\' AND "id" IN (%s, %s, %s)) '
+                          'LIMIT 21'))
@@ -0,0 +1,79 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from benchmarks.regression import SCENARIOS, client_for, count_queries, load_baseline, seed
+from store.models import Book, UserBookRelation
+
+
+@override_settings(STORE_CACHE_TIMEOUT=0)
+class QueryCountRegressionTestCase(APITestCase):
+    """The scenarios of benchmarks.regression on a small dataset issue no
+    more queries than recorded in benchmarks/baseline.json."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed(books=60, readers=10, relations_per_book=3)
+
+    def test_scenarios(self):
+        baseline = load_baseline()['queries']
+        client = client_for(self.dataset)
+        for name, request in SCENARIOS.items():
+            with self.subTest(name):
+                for _ in range(2):
+                    with CaptureQueriesContext(connection) as captured:
+                        response = request(client, self.dataset)
+                    self.assertEqual(200, response.status_code)
+                    self.assertLessEqual(count_queries(captured.captured_queries), baseline[name])
+
+
+class BookWriteQueryCountTestCase(APITestCase):
+    """Updates and deletes read the book row once, locked, and nothing else
+    before they write: not the owner, not the readers."""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.book = Book.objects.create(name='Book', price=10, author='Author', owner=self.owner)
+        for i in range(5):
+            UserBookRelation.objects.create(user=User.objects.create(username=f'reader {i}'), book=self.book,
+                                            like=True, rate=4)
+        self.url = reverse('book-detail', args=(self.book.id,))
+
+    def request(self, user, method, data=None):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(self.url, json.dumps(data), content_type='application/json')
+        return response, count_queries(captured.captured_queries)
+
+    def test_update(self):
+        response, queries = self.request(self.owner, 'put', {'name': 'Book', 'price': '12.00', 'author': 'Author'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(5, len(response.data['readers']))
+        self.assertEqual('owner', response.data['owner_name'])
+        # The book, its UPDATE returning the new version and the readers
+        # preview of the response.
+        self.assertEqual(3, queries)
+
+    def test_update_forbidden(self):
+        response, queries = self.request(User.objects.create(username='other'), 'patch', {'price': '12.00'})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(1, queries)
+
+    def test_update_invalid(self):
+        response, queries = self.request(self.owner, 'patch', {'price': 'free'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(1, queries)
+
+    def test_delete(self):
+        response, queries = self.request(self.owner, 'delete')
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+        # The book, the relations the deletion cascades to, and the two
+        # DELETEs; the counters of the deleted book are not updated.
+        self.assertEqual(4, queries)
@@ -0,0 +1,102 @@
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import similarity
+from store.models import Book, BookSimilarity, UserBookRelation
+from store.recommendations import build_recommendations
+
+
+class SimilarityTestCase(TestCase):
+    def test_block_neighbours(self):
+        rng = np.random.default_rng(1)
+        dense = rng.random((30, 12)) * (rng.random((30, 12)) < 0.3)
+        rows, columns = dense.nonzero()
+        matrix = similarity.interest_matrix(rows, columns, dense[rows, columns], dense.shape)
+
+        unit = dense / np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-300)
+        expected = unit @ unit.T
+        np.fill_diagonal(expected, 0)
+        for block_size, workers in ((7, 1), (30, 1), (8, 2)):
+            with self.subTest(block_size=block_size, workers=workers):
+                blocks = list(similarity.top_neighbours(matrix, 3, block_size, workers))
+                rows, neighbours, scores = (np.concatenate(arrays) for arrays in zip(*blocks))
+                for row in range(30):
+                    mine = rows == row
+                    top = np.sort(expected[row][expected[row] > 0])[::-1][:3]
+                    np.testing.assert_allclose(top, scores[mine])
+                    np.testing.assert_allclose(expected[row, neighbours[mine]], scores[mine])
+
+
+@override_settings(STORE_SIMILAR_BOOKS=2)
+class BuildRecommendationsTestCase(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(name=f'Book {i}', price=10, author='Author') for i in range(5)]
+        readers = [User.objects.create(username=f'reader {i}') for i in range(4)]
+        for reader, books in zip(readers, ([0, 1], [0, 1, 2], [2, 3], [4])):
+            for book in books:
+                UserBookRelation.objects.create(user=reader, book=self.books[book], like=True, rate=5)
+
+    def neighbours(self, book):
+        return [(self.books.index(similar.similar), round(similar.score, 4))
+                for similar in BookSimilarity.objects.filter(book=book).select_related('similar').order_by('rank')]
+
+    def test_build(self):
+        self.assertEqual({'books': 5, 'similarities': 7}, build_recommendations())
+        # Books 0 and 1 have the same readers; book 2 shares one of them.
+        self.assertEqual([(1, 1.0), (2, 0.5)], self.neighbours(self.books[0]))
+        # Book 1 is as close as book 0, ties go to the oldest book.
+        self.assertEqual([(3, 0.7071), (0, 0.5)], self.neighbours(self.books[2]))
+        self.assertEqual([(2, 0.7071)], self.neighbours(self.books[3]))
+        self.assertEqual([], self.neighbours(self.books[4]))
+
+    def test_rebuild(self):
+        build_recommendations()
+        UserBookRelation.objects.filter(book=self.books[3]).delete()
+        build_recommendations(top=1)
+        self.assertEqual([(1, 1.0)], self.neighbours(self.books[0]))
+        self.assertEqual([], self.neighbours(self.books[3]))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_recommendations', '--block-size', '2', stdout=out)
+        self.assertIn('Stored 7 similarities of 5 books', out.getvalue())
+
+
+class SimilarBooksApiTestCase(APITestCase):
+    def setUp(self):
+        self.book, self.other, self.third = (Book.objects.create(name=f'Book {i}', price=10, author='Author')
+                                             for i in range(3))
+        BookSimilarity.objects.bulk_create([
+            BookSimilarity(book=self.book, rank=1, similar=self.third, score=0.75),
+            BookSimilarity(book=self.book, rank=2, similar=self.other, score=0.5),
+        ])
+
+    def test_similar(self):
+        url = reverse('book-similar', args=(self.book.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(queries))
+        self.assertEqual([(0.75, 'Book 2'), (0.5, 'Book 1')],
+                         [(item['score'], item['book']['name']) for item in response.data['results']])
+
+    def test_deleted_neighbour(self):
+        self.third.delete()
+        response = self.client.get(reverse('book-similar', args=(self.book.id,)))
+        self.assertEqual(['Book 1'], [item['book']['name'] for item in response.data['results']])
+
+    def test_none(self):
+        response = self.client.get(reverse('book-similar', args=(self.other.id,)))
+        self.assertEqual({'results': []}, response.data)
+        for pk in (12345, 'x'):
+            response = self.client.get(reverse('book-similar', args=(pk,)))
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
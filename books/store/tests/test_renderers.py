@@ -0,0 +1,80 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from unittest import TestCase, mock, skipIf
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from books.renderers import FastJSONRenderer, orjson
+from store.models import Book
+
+
+class FastJSONRendererTestCase(TestCase):
+    data = ReturnDict({
+        'count': 2,
+        'results': ReturnList([
+            {'id': 1, 'name': 'Война и мир', 'price': '10.50', 'rating': Decimal('4.25'), 'readers': []},
+            {'id': 2, 'name': 'Line\u2028separated\u2029', 'price': Decimal('12'), 'owner_name': None,
+             'liked': True, 'score': 1.5},
+        ], serializer=None),
+        'updated_at': datetime.datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'local': datetime.datetime(2025, 3, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=3))),
+        'naive': datetime.datetime(2025, 3, 1),
+        'date': datetime.date(2025, 3, 1),
+        'time': datetime.time(8, 15, 1, 500),
+        'duration': datetime.timedelta(minutes=2),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'label': gettext_lazy('Book'),
+        'tuple': (1, 'two'),
+        'buckets': {5: 1, 10: 0},
+        'big': 2 ** 70,
+    }, serializer=None)
+
+    def assertRendersLikeJSONRenderer(self, data, accepted_media_type=None):
+        self.assertEqual(JSONRenderer().render(data, accepted_media_type),
+                         FastJSONRenderer().render(data, accepted_media_type))
+
+    def test_stdlib(self):
+        with mock.patch.object(FastJSONRenderer, 'use_orjson', False):
+            self.assertRendersLikeJSONRenderer(self.data)
+            self.assertRendersLikeJSONRenderer(self.data['results'])
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson(self):
+        data = {key: value for key, value in self.data.items() if key != 'big'}
+        with mock.patch.object(orjson, 'dumps', wraps=orjson.dumps) as dumps:
+            self.assertRendersLikeJSONRenderer(data)
+        dumps.assert_called_once()
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_fallback(self):
+        self.assertRendersLikeJSONRenderer(self.data)
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_small_floats(self):
+        data = {'small': 1e-05, 'smaller': -1.5e-07}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(b'{"small":0.00001,"smaller":-1.5e-7}', rendered)
+        self.assertEqual(json.loads(JSONRenderer().render(data)), json.loads(rendered))
+
+    def test_indent(self):
+        self.assertRendersLikeJSONRenderer(self.data, 'application/json; indent=4')
+
+    def test_none(self):
+        self.assertEqual(b'', FastJSONRenderer().render(None))
+
+
+class FastJSONRendererAPITestCase(APITestCase):
+    def test_list(self):
+        user = User.objects.create(username='test_username')
+        Book.objects.create(name='Test book', price='25.10', author='Author 1', owner=user)
+        response = self.client.get(reverse('book-list'))
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual('application/json', response['Content-Type'])
+        self.assertEqual(JSONRenderer().render(response.data), response.content)
@@ -0,0 +1,108 @@
+import json
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from books.urls import async_book_urls, urlpatterns as book_urls
+from store.models import Book
+from store.views import BookViewSet
+
+urlpatterns = async_book_urls + book_urls
+
+# Declared by books.test_settings.
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, 'needs the replica database of books.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'], STORE_CACHE_TIMEOUT=0)
+class ReplicaRoutingTestCase(APITestCase):
+    """The replica database is not replicated to: books that differ between
+    it and default tell where a request read from."""
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='9900')
+        self.book = Book.objects.create(name='Primary book', price=10, author='Author')
+        Book.objects.using('replica').create(id=self.book.id, name='Replica book', price=10, author='Author')
+
+    def names(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['name'] for book in response.json()['results']]
+
+    def test_reads(self):
+        self.assertEqual(['Replica book'], self.names())
+        response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual('Replica book', response.data['name'])
+
+    def test_export(self):
+        response = self.client.get(reverse('book-export'))
+        self.assertEqual(['Replica book'], [json.loads(line)['name'] for line in response.streaming_content])
+
+    def test_round_robin(self):
+        with override_settings(DATABASE_REPLICAS=['replica', 'default']):
+            names = {self.names()[0] for _ in range(4)}
+        self.assertEqual({'Primary book', 'Replica book'}, names)
+
+    def test_no_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(['Primary book'], self.names())
+
+    def test_authentication_on_primary(self):
+        # The session and the user exist on default only.
+        self.client.login(username='reader', password='9900')
+        self.assertEqual(['Replica book'], self.names())
+
+    def test_create_reads_own_writes(self):
+        self.client.force_login(self.user)
+        data = {'name': 'New book', 'price': '12.00', 'author': 'Author'}
+        response = self.client.post(reverse('book-list'), json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertTrue(Book.objects.using('default').filter(name='New book').exists())
+        self.assertFalse(Book.objects.using('replica').filter(name='New book').exists())
+
+        self.assertEqual(['Primary book', 'New book'], self.names())
+        # Other users still read from the replica.
+        self.client.force_login(User.objects.create(username='other'))
+        self.assertEqual(['Replica book'], self.names())
+
+    def test_relation_write_reads_own_writes(self):
+        self.client.force_login(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        response = self.client.patch(url, json.dumps({'like': True}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['Primary book'], self.names())
+
+        cache.clear()  # the window is over
+        self.assertEqual(['Replica book'], self.names())
+
+    def test_list_after_book_change(self):
+        # Only the user who wrote reads lists from the primary, see
+        # test_create_reads_own_writes.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(['Replica book'], self.names())
+
+    def test_failed_write(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('book-list'), json.dumps({'name': ''}), content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['Replica book'], self.names())
+
+    def test_reads_after_error(self):
+        with mock.patch.object(BookViewSet, 'list_page', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get(reverse('book-list'))
+        self.assertEqual('default', Book.objects.all().db)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_async_reads(self):
+        response = await self.async_client.get(reverse('book-list'))
+        self.assertEqual(['Replica book'], [book['name'] for book in response.json()['results']])
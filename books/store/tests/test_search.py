@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.search import RANK, PostgresBookSearch
+
+
+class BookSearchTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.war = Book.objects.create(name='War and Peace', price=10, author='Leo Tolstoy')
+        self.anna = Book.objects.create(name='Anna Karenina', price=20, author='Leo Tolstoy')
+        self.idiot = Book.objects.create(name='The Idiot', price=30, author='Fyodor Dostoevsky')
+        self.peace = Book.objects.create(name='Peace', price=40, author='Peaceful Writer')
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('book-list'), data={'search': term, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_terms(self):
+        self.assertEqual({self.war.id, self.anna.id}, set(self.search('tolstoy')))
+        self.assertEqual([self.anna.id], self.search('leo karenina'))
+        self.assertEqual([self.idiot.id], self.search('DOSTO'))
+        self.assertEqual([], self.search('tolstoy idiot'))
+        self.assertEqual([], self.search('"); DROP TABLE store_book; --'))
+
+    def test_relevance(self):
+        # Matches in the name rank above matches in the author only.
+        self.assertEqual([self.peace.id, self.war.id], self.search('peace', ordering='')[:2])
+        self.assertEqual([self.war.id, self.peace.id], self.search('peace', ordering='price'))
+
+    def test_relevance_pages(self):
+        url = reverse('book-list')
+        expected = self.search('tolstoy')
+        response = self.client.get(url, data={'search': 'tolstoy', 'page_size': 1})
+        ids = [item['id'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [item['id'] for item in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(2, len(ids))
+        self.assertEqual(expected, ids)
+
+    def test_index_follows_writes(self):
+        self.idiot.name = 'Demons'
+        self.idiot.save()
+        self.assertEqual([], self.search('idiot'))
+        self.assertEqual([self.idiot.id], self.search('demons'))
+
+        self.idiot.delete()
+        self.assertEqual([], self.search('demons'))
+
+        Book.objects.bulk_create([Book(name='Crime and Punishment', price=5, author='Fyodor Dostoevsky')])
+        self.assertEqual(1, len(self.search('punishment')))
+
+
+class PostgresBookSearchTestCase(SimpleTestCase):
+    def test_rank_is_double(self):
+        # Keyset cursors hold str(rank), which only a double round-trips.
+        rank = PostgresBookSearch().search(Book.objects.all(), ['peace']).query.annotations[RANK]
+        self.assertIsInstance(rank, Cast)
+        self.assertIsInstance(rank.output_field, FloatField)
@@ -1,10 +1,16 @@
+import random
+from decimal import Decimal
 from unittest import TestCase
 
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg
+from django.test import TestCase as DatabaseTestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
 from store.models import Book, UserBookRelation
-from store.serializers import BookSerializer
+from store.serializers import BookRowsSerializer, BookSerializer
+from store.views import BookViewSet
 
 
 class BookSerializerTestCase(TestCase):
@@ -26,10 +32,7 @@ class BookSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=user2, book=book_2, like=True, rate=4)
         UserBookRelation.objects.create(user=user3, book=book_2, like=False)
 
-        books = Book.objects.all().annotate(
-            annotated_like=Count(Case(When(
-                userbookrelation__like=True, then=1)))
-        ).order_by('id')
+        books = Book.objects.all().order_by('id')
 
         data = BookSerializer(books, many=True).data
         # print(data)
@@ -40,8 +43,9 @@ class BookSerializerTestCase(TestCase):
                 'price': "10.00",
                 'author': 'Author 1',
                 'annotated_like': 3,
-                'rating': '3.67',
+                'rating': '4.67',
                 'owner_name': 'user1',
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'Ivan',
@@ -66,6 +70,7 @@ class BookSerializerTestCase(TestCase):
                 'annotated_like': 2,
                 'rating': '2.67',
                 'owner_name': '',
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'Ivan',
@@ -82,4 +87,52 @@ class BookSerializerTestCase(TestCase):
                 ],
             },
         ]
-        self.assertEqual(data, expected_data)
\ No newline at end of file
+        self.assertEqual(data, expected_data)
+
+@override_settings(STORE_CACHE_TIMEOUT=0)
+class BookRowsSerializerTestCase(DatabaseTestCase):
+    """BookRowsSerializer renders the same JSON as BookSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(16)
+        alphabet = 'abc XYZ 0123 "\\\'<>&é中文😀'
+
+        def text(length):
+            return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, length))).strip() or 'x'
+
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', first_name=text(10) if rng.random() < 0.8 else '', last_name=text(10))
+            for i in range(12))
+        for i in range(80):
+            book = Book.objects.create(
+                name=f'{text(30)} {i}', author=text(20), owner=rng.choice([None, *users]),
+                price=Decimal(rng.choice([0, 1, rng.randint(0, 9999999)])) / 100)
+            for user in rng.sample(users, rng.randint(0, len(users))):
+                UserBookRelation.objects.create(user=user, book=book, like=rng.random() < 0.5,
+                                                in_bookmark=rng.random() < 0.3, rate=rng.randint(1, 5))
+
+    def test_equivalence(self):
+        queryset = BookViewSet.queryset.all()
+        rows = list(BookRowsSerializer.values(queryset))
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(BookSerializer(queryset, many=True).data),
+                         renderer.render(BookRowsSerializer(rows).data))
+
+    def test_list_pages(self):
+        client = APIClient()
+        for params in ({}, {'ordering': '-price', 'page_size': 7}, {'ordering': 'author'}, {'search': 'x'},
+                       {'price': '0.01'}):
+            responses = []
+            for fast in (True, False):
+                with self.settings(STORE_BOOK_FAST_LIST=fast):
+                    pages = []
+                    response = client.get(reverse('book-list'), data=params)
+                    while True:
+                        self.assertEqual(200, response.status_code)
+                        pages.append(response.content)
+                        if not response.data['next']:
+                            break
+                        response = client.get(response.data['next'])
+                    responses.append(pages)
+            self.assertEqual(*responses, params)
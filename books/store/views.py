@@ -1,44 +1,435 @@
-from django.db.models import Count, Case, When, Avg
-from django.shortcuts import render
+import codecs
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError as RequestValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from store.models import Book, UserBookRelation
+from books.renderers import FastJSONRenderer
+from books.routers import PRIMARY, ReplicaReadMixin, awrote_recently, routing
+from store.cache import (abook_key, aget_or_build, alist_etag, book_key, facets_key, get_or_build, list_etag,
+                         list_key)
+from store.facets import book_facets, price_string
+from store.importer import CONTENT_TYPES, import_books, read_rows
+from store.logic import upsert_relation, upsert_relations
+from store.models import Book, BookSimilarity, LeaderboardEntry, UserBookRelation, book_etag
+from store.pagination import BookPagination, ReaderPagination
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BookSerializer, UserBookRelationSerializer
+from store.search import BookOrderingFilter, BookSearchFilter
+from store.serializers import (BookRowsSerializer, BookSerializer, UserBookRelationSerializer, BookReaderSerializer,
+                               BookSimilaritySerializer, FacetQuerySerializer, LeaderboardEntrySerializer,
+                               LeaderboardQuerySerializer)
 
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all().annotate(
-            annotated_like=Count(Case(When(
-                userbookrelation__like=True, then=1)))
-        ).select_related('owner').prefetch_related('readers').order_by('id')
+class BookViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    # Only a preview of the readers is embedded; all of them are paginated
+    # by the readers action.
+    readers_preview = Prefetch('readers', queryset=User.objects.only('id', 'first_name', 'last_name').order_by('id')[
+        :settings.STORE_BOOK_READERS_PREVIEW], to_attr='readers_preview')
+    queryset = Book.objects.all().select_related('owner').prefetch_related(readers_preview).order_by('id')
 
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = BookPagination
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, BookOrderingFilter]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
     filterset_fields = ['price']
     search_fields = ['name', 'author']
     ordering_fields = ['price', 'author']
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, lambda: self.list_page(request, *args, **kwargs))
+
+    def conditional_list(self, request, respond):
+        """The list response: 304 if the ETag matches, else the cached one or
+        respond(). The ETag does not come from the database, see
+        store.cache."""
+        etag = list_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.cached_response('list', list_key(etag), respond)
+        response['ETag'] = etag
+        return response
+
+    def list_page(self, request, *args, **kwargs):
+        """The uncached list response, built through BookRowsSerializer
+        unless STORE_BOOK_FAST_LIST is off."""
+        if not settings.STORE_BOOK_FAST_LIST:
+            return super().list(request, *args, **kwargs)
+        rows = BookRowsSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(BookRowsSerializer(list(rows)).data)
+        return self.get_paginated_response(BookRowsSerializer(page).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, kwargs[self.lookup_field], lambda: super(
+            BookViewSet, self).retrieve(request, *args, **kwargs))
+
+    def conditional_retrieve(self, request, pk, respond):
+        """The book response: 304 if the validators match, else the cached
+        one or respond()."""
+        etag, last_modified = self.book_validators(pk)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached_response('book', book_key(pk, etag), respond)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return super().get_queryset()
+        # Writes lock the book row until they commit, so an If-Match
+        # precondition cannot be overtaken by a concurrent update. The readers
+        # preview is only fetched for the response of a successful update.
+        return Book.objects.select_for_update(of=('self',)).select_related('owner')
+
+    def get_object(self):
+        # Writes check their preconditions on the object they go on to change.
+        if not hasattr(self, 'object'):
+            self.object = super().get_object()
+        return self.object
+
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        failed = self.failed_precondition(request)
+        if failed is not None:
+            return failed
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.etag
+        return response
+
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        failed = self.failed_precondition(request)
+        if failed is not None:
+            return failed
+        return super().destroy(request, *args, **kwargs)
+
+    def failed_precondition(self, request):
+        book = self.get_object()
+        return get_conditional_response(request, etag=book.etag, last_modified=int(book.updated_at.timestamp()))
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        prefetch_related_objects([serializer.instance], self.readers_preview)
+        self.etag = serializer.instance.etag
+
+    def book_validators(self, pk):
+        """ETag and Last-Modified timestamp of a book, read with one query on
+        the book row alone."""
+        try:
+            book = Book.objects.filter(pk=pk).values('version', 'updated_at').first()
+        except (TypeError, ValueError, ValidationError):
+            book = None
+        return self.validators_of(pk, book)
+
+    async def abook_validators(self, pk):
+        try:
+            book = await Book.objects.filter(pk=pk).values('version', 'updated_at').afirst()
+        except (TypeError, ValueError, ValidationError):
+            book = None
+        return self.validators_of(pk, book)
+
+    @staticmethod
+    def validators_of(pk, book):
+        if book is None:
+            raise Http404
+        return book_etag(pk, book['version']), int(book['updated_at'].timestamp())
+
+    @staticmethod
+    def cached_response(kind, key, respond):
+        response = None
+
+        def build():
+            nonlocal response
+            response = respond()
+            return response.data if response.status_code == 200 else None
+
+        data, hit = get_or_build(kind, key, build)
+        if response is None:
+            response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    # The GET of list() and retrieve() for BookReadView: the same validators,
+    # cache keys and responses, through the async ORM and cache APIs.
+
+    async def ainitial(self, request, *args, **kwargs):
+        """initial() with its I/O done beforehand: the user comes from
+        Django's async session API, or from DRF in a thread for HTTP Basic
+        and other schemes that read the database, and the read-your-writes
+        window from awrote_recently(). initial() then does no I/O."""
+        if 'HTTP_AUTHORIZATION' in request.META:
+            await sync_to_async(self.perform_authentication)(request)
+        else:
+            request.user = await request._request.auser()
+        if settings.DATABASE_REPLICAS:
+            self.recent_write = await awrote_recently(request.user)
+        self.initial(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        etag = await alist_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await self.acached_response('list', list_key(etag), self.alist_page)
+        response['ETag'] = etag
+        return response
+
+    async def alist_page(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        fast = settings.STORE_BOOK_FAST_LIST
+        if fast:
+            queryset = BookRowsSerializer.values(queryset)
+        page = books = None
+        if self.paginator is not None:
+            page = books = await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        if page is None:
+            books = [book async for book in queryset]
+        if fast:
+            readers = await BookRowsSerializer.areaders_preview([row['id'] for row in books])
+            data = BookRowsSerializer(books, context={'readers': readers}).data
+        else:
+            data = self.get_serializer(books, many=True).data
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        etag, last_modified = await self.abook_validators(pk)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await self.acached_response('book', await abook_key(pk, etag), self.aretrieve_book)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    async def aretrieve_book(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            book = await queryset.aget(**{self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]})
+        except (Book.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, book)
+        return Response(self.get_serializer(book).data)
+
+    @staticmethod
+    async def acached_response(kind, key, respond):
+        response = None
+
+        async def build():
+            nonlocal response
+            response = await respond()
+            return response.data if response.status_code == 200 else None
+
+        data, hit = await aget_or_build(kind, key, build)
+        if response is None:
+            response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=True)
+    def readers(self, request, pk=None):
+        book = get_object_or_404(Book.objects.only('id'), pk=pk)
+        readers = book.readers.only('id', 'first_name', 'last_name')
+        paginator = ReaderPagination()
+        page = paginator.paginate_queryset(readers, request, view=self)
+        return paginator.get_paginated_response(BookReaderSerializer(page, many=True).data)
+
+    @action(detail=False)
+    def facets(self, request):
+        """Price histogram and top authors of the books matching the filters
+        and search of the list, in buckets of ?price_bucket= and for
+        ?authors= authors."""
+        query = FacetQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        price_bucket = query.validated_data.get('price_bucket', settings.STORE_FACET_PRICE_BUCKET)
+        authors = query.validated_data.get('authors', settings.STORE_FACET_AUTHORS)
+        # Only the parameters that select books are part of the key.
+        params = {*self.filterset_fields, BookSearchFilter.search_param}
+        key = facets_key(request, params, price_string(price_bucket), authors)
+        # Computed on the primary: misses are rare, and a lagging replica would
+        # have its counts cached under the version of a write it has not seen.
+        return self.cached_response('facets', key, lambda: Response(book_facets(
+            self.filter_queryset(Book.objects.using(PRIMARY)), price_bucket, authors)))
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """The books most similar to this one for their readers, as last
+        computed by manage.py build_recommendations."""
+        try:
+            similarities = list(BookSimilarity.objects.filter(book=pk).select_related('similar').order_by('rank'))
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not similarities:
+            get_object_or_404(Book.objects.only('id'), pk=pk)
+        return Response({'results': BookSimilaritySerializer(similarities, many=True).data})
+
+    @action(detail=False, url_path=r'leaderboard/(?P<board>rating|likes|bookmarks)')
+    def leaderboard(self, request, board):
+        """The first ?limit= books of a leaderboard precomputed by
+        store.leaderboards, of the whole catalogue or of one ?author=."""
+        query = LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        author = query.validated_data['author']
+        limit = query.validated_data.get('limit', settings.STORE_LEADERBOARD_SIZE)
+        entries = list(LeaderboardEntry.objects.filter(board=board, author=author).select_related('book')
+                       .order_by('position')[:limit])
+        return Response({
+            'board': board,
+            'author': author,
+            'refreshed_at': entries[0].refreshed_at if entries else None,
+            'results': LeaderboardEntrySerializer(entries, many=True).data,
+        })
+
+    @action(detail=False)
+    def export(self, request):
+        """Stream every book matching the filters, as NDJSON by default or as
+        one JSON array with ?output=json. Rows are read through a server-side
+        cursor and serialized chunk by chunk, so memory use does not depend
+        on the size of the catalogue."""
+        as_array = request.query_params.get('output') == 'json'
+        queryset = self.filter_queryset(self.get_queryset())
+        # The stream is consumed after dispatch() has routed reads
+        # back to the primary.
+        queryset = queryset.using(queryset.db)
+        rows = self.export_rows(queryset, settings.STORE_EXPORT_CHUNK_SIZE)
+        if as_array:
+            content, content_type = self.json_array(rows), 'application/json'
+        else:
+            content, content_type = (row + b'\n' for row in rows), 'application/x-ndjson'
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def export_rows(self, queryset, chunk_size):
+        renderer = FastJSONRenderer()
+        books = queryset.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(books, chunk_size)):
+            for row in self.get_serializer(chunk, many=True).data:
+                yield renderer.render(row)
+
+    @staticmethod
+    def json_array(rows):
+        yield b'['
+        for index, row in enumerate(rows):
+            yield row if index == 0 else b',' + row
+        yield b']'
 
-class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def import_books(self, request):
+        """Create or update books matched on name and author, from a JSON
+        array, or from a CSV or NDJSON body read as it streams in. Invalid
+        rows are reported by row number and skipped."""
+        format = CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if format is not None:
+            rows = read_rows(codecs.iterdecode(request.stream or (), 'utf-8'), format)
+        elif isinstance(request.data, list):
+            rows = enumerate(request.data, start=1)
+        else:
+            raise RequestValidationError('Expected a list of books.')
+
+        errors = []
+        counts = import_books(rows, owner=request.user,
+                              on_error=lambda number, detail: errors.append({'row': number, 'errors': detail}))
+        return Response({**counts, 'errors': errors})
+
+
+class BookReadView(View):
+    """GET of the book list, or with detail=True of one book, through
+    BookViewSet.ainitial(), alist() and aretrieve(): the session user, the
+    validators, the cache and the pages are awaited on the async APIs of
+    Django, with no thread of the view's own. Django's async ORM still runs
+    each query in a thread for now, see benchmarks.book_async. books.urls
+    routes the two BookViewSet URLs here when STORE_ASYNC_READS is set.
+
+    Any other method goes to the sync BookViewSet view, in a thread, the
+    way Django runs sync views under ASGI."""
+    detail = False
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, detail=False):
+        if detail:
+            actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+        else:
+            actions = {'get': 'list', 'post': 'create'}
+        sync_view = sync_to_async(BookViewSet.as_view(actions, basename='book', detail=detail))
+        # Like every DRF view; SessionAuthentication enforces CSRF itself.
+        return csrf_exempt(super().as_view(detail=detail, sync_view=sync_view))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await self.get(request, *args, **kwargs)
+        return await self.sync_view(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        action = 'retrieve' if self.detail else 'list'
+        viewset = BookViewSet(action_map={'get': action, 'head': action}, basename='book', detail=self.detail)
+        viewset.args, viewset.kwargs = args, kwargs
+        viewset.request = request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        with routing():
+            try:
+                await viewset.ainitial(request, *args, **kwargs)
+                handler = viewset.aretrieve if self.detail else viewset.alist
+                response = await handler(request, *args, **kwargs)
+            except Exception as exc:
+                response = viewset.handle_exception(exc)
+            return viewset.finalize_response(request, response, *args, **kwargs)
+
+
+class UserBooksRelationView(ReplicaReadMixin, UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     lookup_field = 'book'
 
-    def get_object(self):
-        obj, created = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
-        return obj
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        # The relation is upserted, it is never read through get_object().
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        values = {field: value for field, value in serializer.validated_data.items() if field != 'book'}
+        try:
+            relation = upsert_relation(request.user, self.kwargs['book'], values)
+        except (TypeError, ValueError, ValidationError):
+            relation = None
+        if relation is None:
+            raise Http404
+        return Response(self.get_serializer(relation).data)
+
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
+    def bulk(self, request):
+        """Create or update the relations of the user to many books at once
+        from a list of {book, like, in_bookmark, rate} items; fields left out
+        keep their current value."""
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False,
+                                         max_length=settings.STORE_RELATION_BULK_MAX_ITEMS)
+        serializer.is_valid(raise_exception=True)
+        items = {item.pop('book').pk: item for item in serializer.validated_data}
+        relations = upsert_relations(request.user, items)
+        return Response(self.get_serializer(relations, many=True).data)
 
 
 def auth(request):